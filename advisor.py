@@ -0,0 +1,112 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import db
+import instrument
+from cache import cached
+
+# Support for the AI Chatbot tab: a compact financial context built from the
+# summary tables (recomputed only when the user's data version changes), and a
+# response cache so repeated questions skip the model entirely. Answers are keyed
+# by (user, data version, normalized prompt, model): any write to the user's rows
+# makes their old answers unreachable.
+
+RESPONSE_TTL = float(os.getenv("ADVISOR_CACHE_TTL", "3600"))
+RESPONSE_MAX_ENTRIES = int(os.getenv("ADVISOR_CACHE_SIZE", "512"))
+# Opt-in: also keep answers in tracker.db so they survive restarts and are shared by every process.
+PERSIST = os.getenv("ADVISOR_CACHE_PERSIST", "0").lower() in ("1", "true", "yes")
+
+
+@instrument.timed("advisor.build_context")
+def build_context(user_id):
+    income, expense = db.get_totals(user_id)
+    lines = [
+        "User Financial Snapshot:",
+        f"- Total Income: ₹{income:,.2f}",
+        f"- Total Expenses: ₹{expense:,.2f}",
+        f"- Current Balance: ₹{income - expense:,.2f}",
+    ]
+    top = db.get_top_groups(user_id, "expenses", 3)
+    if top:
+        lines.append("- Top spending categories: " + ", ".join(
+            f"{name or 'Uncategorised'} ₹{amount:,.2f}" + (f" ({amount / expense:.0%})" if expense else "")
+            for name, amount in top))
+    months = db.get_recent_months(user_id, 3)
+    if months:
+        lines.append("- Last 3 months (income / expenses): " + "; ".join(
+            f"{month}: ₹{inc:,.2f} / ₹{exp:,.2f}" for month, inc, exp in months))
+    return "\n".join(lines)
+
+
+# Cached per (user, data version) in the shared query cache.
+financial_context = cached(build_context)
+
+
+def normalize_prompt(prompt):
+    """Fold case, whitespace and trailing punctuation so near-identical questions share an answer."""
+    text = re.sub(r"\s+", " ", prompt.strip().lower())
+    return text.strip(" ?!.")
+
+
+class ResponseCache:
+    def __init__(self, ttl=RESPONSE_TTL, max_entries=RESPONSE_MAX_ENTRIES, persist=PERSIST):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.persist = persist
+        self._entries = OrderedDict()  # key -> (answer, created_at)
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    @staticmethod
+    def _prompt_key(prompt):
+        return hashlib.sha256(normalize_prompt(prompt).encode()).hexdigest()
+
+    def get(self, user_id, version, prompt, model):
+        prompt_key = self._prompt_key(prompt)
+        key = (user_id, version, prompt_key, model)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now - entry[1] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self._entries.pop(key, None)
+        if self.persist:
+            row = db.query_one("SELECT answer, created_at FROM llm_responses WHERE user_id=? AND prompt_key=? "
+                               "AND model=? AND version=? AND created_at >= ?",
+                               (user_id, prompt_key, model, version, now - self.ttl))
+            if row:
+                self._remember(key, row[0], row[1])
+                with self._lock:
+                    self.hits += 1
+                return row[0]
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, user_id, version, prompt, model, answer, writer=db):
+        # writer is db or a backend.BackendClient, like every other write.
+        prompt_key = self._prompt_key(prompt)
+        now = time.time()
+        self._remember((user_id, version, prompt_key, model), answer, now)
+        if self.persist:
+            writer.save_llm_response(user_id, prompt_key, model, version, answer, now, self.ttl)
+
+    def _remember(self, key, answer, created_at):
+        with self._lock:
+            self._entries[key] = (answer, created_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+response_cache = ResponseCache()
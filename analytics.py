@@ -0,0 +1,206 @@
+import argparse
+import os
+import threading
+
+import db
+
+# Engines for the analytical reads behind the Reports view: category
+# breakdowns, month-wise trends and year-over-year comparisons. The default is
+# db itself (SQLite, mostly served from the summary tables). With
+# TRACKER_ANALYTICS=duckdb the same functions run in DuckDB instead, either
+# straight over tracker.db (needs DuckDB's sqlite extension) or over a Parquet
+# snapshot directory written by snapshot():
+#
+#   python analytics.py --snapshot snapshot/
+#   TRACKER_ANALYTICS=duckdb TRACKER_ANALYTICS_SOURCE=snapshot/ streamlit run app.py
+#   python analytics.py --check --source snapshot/
+#
+# A snapshot is as of when it was written; re-run --snapshot to refresh it. The
+# Reports view says so, and takes its date range from the snapshot too.
+# --check runs both engines for every user and reports any result that differs.
+
+ENGINE = os.getenv("TRACKER_ANALYTICS", "sqlite").lower()
+SOURCE = os.getenv("TRACKER_ANALYTICS_SOURCE", "")  # tracker.db or a snapshot directory
+TOLERANCE = 0.005
+SNAPSHOT_ROW_GROUP = 100_000
+
+MONTH = "strftime(TRY_CAST(date AS DATE), '%Y-%m')"
+
+
+class DuckDBAnalytics:
+    """DuckDB implementation of db's analytical reads, with the same names, arguments and result columns."""
+
+    def __init__(self, source=None):
+        import duckdb
+        source = source or SOURCE or db.DB_PATH
+        self.source = source
+        self.conn = duckdb.connect()
+        if os.path.isdir(source):
+            for table in db.GROUP_COLUMNS:
+                path = os.path.join(source, f"{table}.parquet").replace("'", "''")
+                self.conn.execute(f"CREATE VIEW {table} AS SELECT * FROM read_parquet('{path}')")
+        else:
+            try:
+                quoted = source.replace("'", "''")
+                self.conn.execute(f"ATTACH '{quoted}' AS tracker (TYPE sqlite, READ_ONLY)")
+            except duckdb.Error as e:
+                raise RuntimeError(f"DuckDB can't read {source} directly ({e}). Write a Parquet snapshot with "
+                                   f"`python analytics.py --snapshot DIR` and point TRACKER_ANALYTICS_SOURCE at it.")
+            for table in db.GROUP_COLUMNS:
+                self.conn.execute(f"CREATE VIEW {table} AS SELECT * FROM tracker.{table}")
+
+    def _frame(self, sql, params):
+        # One cursor per call: cursors are safe to use from concurrent sessions.
+        with self.conn.cursor() as cursor:
+            return cursor.execute(sql, params).df()
+
+    def as_of(self):
+        """When the Parquet snapshot was written (epoch seconds), or None when reading the live database."""
+        if not os.path.isdir(self.source):
+            return None
+        return max(os.path.getmtime(os.path.join(self.source, f"{table}.parquet")) for table in db.GROUP_COLUMNS)
+
+    def get_date_bounds(self, user_id, table="expenses"):
+        if table not in db.GROUP_COLUMNS:
+            raise ValueError(f"Unknown table: {table}")
+        with self.conn.cursor() as cursor:
+            return cursor.execute(f"SELECT MIN(date), MAX(date) FROM {table} WHERE user_id=?", [user_id]).fetchone()
+
+    def get_group_totals(self, user_id, table="expenses", date_from=None, date_to=None):
+        column = db.GROUP_COLUMNS[table]
+        where, params = db._user_filter(user_id, date_from, date_to)
+        # The summary tables db reads for the whole history store a missing category as ''.
+        group = f"COALESCE({column}, '')" if date_from is None and date_to is None else column
+        return self._frame(f"SELECT {group} AS {column}, SUM(amount) AS amount FROM {table} "
+                           f"WHERE {where} GROUP BY 1 ORDER BY 1 NULLS FIRST", params)
+
+    def get_monthly_totals(self, user_id, table="expenses", date_from=None, date_to=None):
+        if table not in db.GROUP_COLUMNS:
+            raise ValueError(f"Unknown table: {table}")
+        where, params = db._user_filter(user_id, date_from, date_to)
+        return self._frame(f"SELECT {MONTH} AS month, SUM(amount) AS amount FROM {table} "
+                           f"WHERE {where} AND {MONTH} IS NOT NULL GROUP BY 1 ORDER BY 1", params)
+
+    def get_year_over_year(self, user_id, table="expenses", date_from=None, date_to=None):
+        where, params = db._user_filter(user_id, date_from, date_to)
+        return self._frame(f"SELECT CAST(year(TRY_CAST(date AS DATE)) AS VARCHAR) AS year, "
+                           f"CAST(month(TRY_CAST(date AS DATE)) AS INTEGER) AS month, SUM(amount) AS amount "
+                           f"FROM {table} WHERE {where} AND TRY_CAST(date AS DATE) IS NOT NULL "
+                           f"GROUP BY 1, 2 ORDER BY 1, 2", params)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def engine():
+    """The configured analytics engine: db (SQLite) or a shared DuckDBAnalytics."""
+    global _engine
+    if ENGINE != "duckdb":
+        return db
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = DuckDBAnalytics()
+    return _engine
+
+
+def as_of():
+    """Snapshot time of the configured engine, or None when it reads live data."""
+    current = engine()
+    return current.as_of() if current is not db else None
+
+
+def snapshot(out_dir):
+    """Write expenses.parquet and income.parquet (sorted by user, then date) for DuckDB to read."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    os.makedirs(out_dir, exist_ok=True)
+    counts = {}
+    for table, column in db.GROUP_COLUMNS.items():
+        schema = pa.schema([("id", pa.int64()), ("user_id", pa.int64()), ("amount", pa.float64()),
+                            (column, pa.string()), ("note", pa.string()), ("date", pa.string())])
+        rows = db.iter_rows(f"SELECT id, user_id, amount, {column}, note, date FROM {table} "
+                            f"ORDER BY user_id, date", chunk_size=SNAPSHOT_ROW_GROUP)
+        next(rows)
+        path = os.path.join(out_dir, f"{table}.parquet")
+        # Sorted row groups let DuckDB skip every group that can't hold the user's rows.
+        counts[table] = 0
+        with pq.ParquetWriter(path + ".tmp", schema) as writer:
+            for chunk in rows:
+                writer.write_table(pa.Table.from_arrays(
+                    [pa.array(col, type=field.type) for col, field in zip(zip(*chunk), schema)], schema=schema))
+                counts[table] += len(chunk)
+        os.replace(path + ".tmp", path)
+    return counts
+
+
+# --------- Parity ----------
+def _rows(frame):
+    if isinstance(frame, tuple):
+        return [frame]
+    return [tuple(row) for row in frame.astype(object).where(frame.notna(), None).itertuples(index=False)]
+
+
+def _same(a, b, tolerance=TOLERANCE):
+    if len(a) != len(b):
+        return False
+    for row_a, row_b in zip(a, b):
+        for x, y in zip(row_a, row_b):
+            if isinstance(x, float) or isinstance(y, float):
+                if x is None or y is None or abs(x - y) > tolerance:
+                    return False
+            elif x != y:
+                return False
+    return True
+
+
+def check(other, user_ids=None, reference=db):
+    """Run every analytical read on both engines; returns [(call, reference rows, other rows)] that differ."""
+    if user_ids is None:
+        user_ids = [row[0] for row in db.query("SELECT DISTINCT user_id FROM expenses "
+                                               "UNION SELECT DISTINCT user_id FROM income")]
+    mismatches = []
+    for user_id in user_ids:
+        for table in db.GROUP_COLUMNS:
+            first, last = db.get_date_bounds(user_id, table)
+            calls = [("get_date_bounds", (user_id, table)), ("get_group_totals", (user_id, table)),
+                     ("get_monthly_totals", (user_id, table)), ("get_year_over_year", (user_id, table))]
+            if first is not None:
+                middle = f"{first[:4]}-12-31"
+                calls += [("get_group_totals", (user_id, table, first, middle)),
+                          ("get_monthly_totals", (user_id, table, middle, last)),
+                          ("get_year_over_year", (user_id, table, middle, last))]
+            for name, args in calls:
+                expected = _rows(getattr(reference, name)(*args))
+                actual = _rows(getattr(other, name)(*args))
+                if not _same(expected, actual):
+                    mismatches.append((f"{name}{args}", expected, actual))
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parquet snapshots and SQLite/DuckDB parity checks.")
+    parser.add_argument("--db", default=db.DB_PATH, help="database file (default: %(default)s)")
+    parser.add_argument("--snapshot", metavar="DIR", help="write a Parquet snapshot of the database to DIR")
+    parser.add_argument("--check", action="store_true", help="compare DuckDB results against SQLite")
+    parser.add_argument("--source", help="what DuckDB reads for --check: the database or a snapshot DIR")
+    parser.add_argument("--user", type=int, action="append", help="only check these user ids")
+    args = parser.parse_args()
+
+    db.configure(args.db)
+    if args.snapshot:
+        counts = snapshot(args.snapshot)
+        print(f"Wrote {', '.join(f'{n:,} {table}' for table, n in counts.items())} rows to {args.snapshot}")
+    if args.check:
+        mismatches = check(DuckDBAnalytics(args.source or args.snapshot or args.db), args.user)
+        for call, expected, actual in mismatches[:20]:
+            print(f"MISMATCH {call}\n  sqlite: {expected[:10]}\n  duckdb: {actual[:10]}")
+        if mismatches:
+            print(f"{len(mismatches)} result(s) differ.")
+            raise SystemExit(1)
+        print("DuckDB and SQLite agree on every analytical read.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,38 @@
 import streamlit as st
 import sqlite3
-import bcrypt
-import pandas as pd
-import plotly.express as px
 from datetime import datetime
 import requests
 from dotenv import load_dotenv
-import os
 
 # Load environment variables
 load_dotenv()
 
+# Local modules read their settings (TRACKER_DB, OLLAMA_*) from the environment at import.
+import advisor
+import analytics
+import auth
+import backend
+import db
+import exporter
+import importer
+import instrument
+import llm
+import reports
+from db_init import migrate
+from cache import cached, query_cache
+from db import EXPENSE_CATEGORIES, get_user
+
+# Per-user reads are served from the shared query cache until that user's next write.
+get_totals = cached(db.get_totals)
+get_date_bounds = cached(db.get_date_bounds)
+count_history = cached(db.count_history)
+get_history_page = cached(db.get_history_page)
+search_history = cached(db.search_history)
+
+PAGE_SIZES = [10, 25, 50, 100]
+VIEWS = ["🏠 Dashboard", "🧾 Expenses", "💵 Income", "📊 Reports", "🤖 AI Chatbot"]
+VIEW_METRICS = dict(zip(VIEWS, ["view.dashboard", "view.expenses", "view.income", "view.reports", "view.chatbot"]))
+
 # Global Theme & Style
 st.set_page_config(page_title="Expense Tracker", page_icon="💰", layout="wide")
 st.markdown("""
@@ -44,84 +66,40 @@ st.markdown("""
     </style>
     """, unsafe_allow_html=True)
 
-# --------- DB Functions (unchanged) ----------
-def get_db():
-    return sqlite3.connect('tracker.db', check_same_thread=False)
-
-def get_user(username):
-    conn = get_db()
-    c = conn.cursor()
-    c.execute("SELECT * FROM users WHERE username=?", (username,))
-    user = c.fetchone()
-    conn.close()
-    return user
-
-def verify_password(password, hashed):
-    return bcrypt.checkpw(password.encode(), hashed.encode())
-
-def get_user_id(username):
-    user = get_user(username)
-    return user[0] if user else None
-
-def add_expense(user_id, amount, category, note, date):
-    conn = get_db()
-    c = conn.cursor()
-    c.execute("INSERT INTO expenses (user_id, amount, category, note, date) VALUES (?, ?, ?, ?, ?)",
-              (user_id, amount, category, note, date))
-    conn.commit()
-    conn.close()
-
-def add_income(user_id, amount, source, note, date):
-    conn = get_db()
-    c = conn.cursor()
-    c.execute("INSERT INTO income (user_id, amount, source, note, date) VALUES (?, ?, ?, ?, ?)",
-              (user_id, amount, source, note, date))
-    conn.commit()
-    conn.close()
-
-def get_expenses(user_id):
-    conn = get_db()
-    df = pd.read_sql_query(f"SELECT * FROM expenses WHERE user_id={user_id}", conn)
-    conn.close()
-    return df
-
-def get_income(user_id):
-    conn = get_db()
-    df = pd.read_sql_query(f"SELECT * FROM income WHERE user_id={user_id}", conn)
-    conn.close()
-    return df
-
-def delete_expense(expense_id):
-    conn = get_db()
-    c = conn.cursor()
-    c.execute("DELETE FROM expenses WHERE id=?", (expense_id,))
-    conn.commit()
-    conn.close()
-
-def delete_income(income_id):
-    conn = get_db()
-    c = conn.cursor()
-    c.execute("DELETE FROM income WHERE id=?", (income_id,))
-    conn.commit()
-    conn.close()
-
-def update_expense(expense_id, amount, category, note, date):
-    conn = get_db()
-    c = conn.cursor()
-    c.execute("UPDATE expenses SET amount=?, category=?, note=?, date=? WHERE id=?",
-              (amount, category, note, date, expense_id))
-    conn.commit()
-    conn.close()
-
-def update_income(income_id, amount, source, note, date):
-    conn = get_db()
-    c = conn.cursor()
-    c.execute("UPDATE income SET amount=?, source=?, note=?, date=? WHERE id=?",
-              (amount, source, note, date, income_id))
-    conn.commit()
-    conn.close()
-
-# --------- Login Screen (unchanged) ----------
+# --------- DB Functions ----------
+@st.cache_resource
+def get_pool():
+    # One pool per server process, shared by every session. Also brings an
+    # existing tracker.db up to the latest schema before the first query.
+    pool = db.configure(db.DB_PATH)
+    with pool.connection() as conn:
+        migrate(conn)
+    return pool
+
+@st.cache_resource
+def get_llm_client():
+    # Shared keep-alive session; host, model, timeouts and retries come from the environment.
+    return llm.OllamaClient()
+
+@st.cache_resource
+def get_writer():
+    # With TRACKER_BACKEND set, writes go through the backend's single writer so
+    # several app processes can share tracker.db; reads stay on the local WAL database.
+    return backend.BackendClient() if backend.BACKEND_URL else db
+
+@st.cache_resource
+def get_metrics_server():
+    # Optional /metrics endpoint for Prometheus, one per server process.
+    return instrument.serve() if instrument.ENABLED and instrument.METRICS_PORT else None
+
+def session_user_id():
+    # The signed token from login carries the user id, so reruns skip the users table.
+    session = auth.read_token(st.session_state.get("auth_token"))
+    if session and session[1] == st.session_state.get("username"):
+        return session[0]
+    return None
+
+# --------- Login Screen ----------
 def login_screen():
     st.markdown("""
         <div class="login-card">
@@ -137,17 +115,22 @@ def login_screen():
     login_clicked = col1.button("Login", use_container_width=True, key="lbtn1")
     sec = col2.button("Create Account", use_container_width=True, key="lbtn2")
     if login_clicked:
-        user = get_user(username)
-        if user and verify_password(password, user[2]):
-            st.session_state["username"] = username
-            st.session_state.page = "dashboard"
+        try:
+            user_id = auth.login(username, password, get_writer())
+        except auth.Throttled as e:
+            st.error(str(e))
         else:
-            st.error("Wrong username or password.")
+            if user_id:
+                st.session_state["username"] = username
+                st.session_state["auth_token"] = auth.issue_token(user_id, username)
+                st.session_state.page = "dashboard"
+            else:
+                st.error("Wrong username or password.")
     if sec:
         st.session_state.page = "register"
     st.markdown("</div>", unsafe_allow_html=True)
 
-# --------- Register Screen (unchanged) ----------
+# --------- Register Screen ----------
 def register_screen():
     st.markdown("""
         <div class="login-card">
@@ -169,23 +152,17 @@ def register_screen():
         elif get_user(username):
             st.error("Username already exists.")
         else:
-            hashed = bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
-            conn = get_db()
-            conn.execute("INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)", (username, email, hashed))
-            conn.commit()
-            conn.close()
+            hashed = auth.hash_password(password)
+            get_writer().create_user(username, email, hashed)
             st.success("Account created! Please log in.")
             st.session_state.page = "login"
     if back_clicked:
         st.session_state.page = "login"
     st.markdown("</div>", unsafe_allow_html=True)
 
-# --------- AI Chatbot Tab (Updated) ----------
+# --------- AI Chatbot ----------
 def advisor_tab(user_id):
     st.header("🤖 AI FINANCE CHATBOT")
-    # Load Ollama host from environment variable
-    ollama_host = os.getenv("OLLAMA_HOST", "http://localhost:11434")
-    
     if "messages" not in st.session_state:
         st.session_state.messages = [{"role": "assistant", "content": "Hi! Ask me anything about your finances 💰"}]
 
@@ -198,59 +175,161 @@ def advisor_tab(user_id):
 
         with st.chat_message("user"):
             st.write(prompt)
-        exp_df = get_expenses(user_id)
-        inc_df = get_income(user_id)
-        total_exp = exp_df['amount'].sum() if not exp_df.empty else 0
-        total_inc = inc_df['amount'].sum() if not inc_df.empty else 0
-        bal = total_inc - total_exp
-        context = f"""
-        User Financial Snapshot:
-        - Total Expenses: ₹{total_exp:,.2f}
-        - Total Income: ₹{total_inc:,.2f}
-        - Current Balance: ₹{bal:,.2f}
-        """
+        context = advisor.financial_context(user_id)
         with st.chat_message("assistant"):
-            with st.spinner("Analyzing using Ollama model..."):
-                try:
-                    response = requests.post(
-                        f"{ollama_host}/api/chat",
-                        json={
-                            "model": "phi3:3.8b",
-                            "messages": [
-                                {"role": "system", "content": "You are a helpful polite Indian finance advisor AI."},
-                                {"role": "user", "content": f"{context}\n\nQuestion: {prompt}"}
-                            ],
-                            "stream": False
-                        },
-                        timeout=180,
-                        verify=False  # Handle ngrok's self-signed certificates
-                    )
-                    if response.status_code == 200:
-                        result = response.json()
-                        answer = result.get("message", {}).get("content", "No 'content' in API response.")
-                    else:
-                        st.error(f"Status Code: {response.status_code}")
-                        st.error(f"Response Text: {response.text}")
-                        answer = "Sorry, API returned an error. Check server logs or ensure the Colab server is running."
-                    st.write(answer)
-                    st.session_state.messages.append({"role": "assistant", "content": answer})
-                except requests.exceptions.ConnectionError:
-                    st.error(f"❌ Cannot connect to Ollama server at {ollama_host}. Ensure the Colab server is running and the ngrok URL is valid.")
-                except requests.exceptions.Timeout:
-                    st.error(f"❌ Request to {ollama_host} timed out. The server might be slow or offline.")
-                except Exception as e:
-                    st.error(f"Error: {str(e)}")
-
-# --------- Dashboard & Tabs (unchanged) ----------
+            client = get_llm_client()
+            version = db.data_version(user_id)
+            cached_answer = advisor.response_cache.get(user_id, version, prompt, client.model)
+            if cached_answer is not None:
+                st.write(cached_answer)
+                st.caption("Answered from cache")
+                st.session_state.messages.append({"role": "assistant", "content": cached_answer})
+                return
+            # Clicking Stop reruns the script, which abandons the generator and
+            # closes its connection mid-stream.
+            st.button("⏹ Stop", key="stop_stream")
+            metrics = {}
+            try:
+                answer = st.write_stream(client.chat_stream(llm.advisor_messages(context, prompt), metrics=metrics))
+                st.caption(f"First token in {metrics['ttft'] or 0:.2f}s · {metrics['tokens_per_sec']:.1f} tokens/s")
+                st.session_state.messages.append({"role": "assistant", "content": answer})
+                advisor.response_cache.put(user_id, version, prompt, client.model, answer, get_writer())
+            except llm.OllamaError as e:
+                st.error(str(e))
+                st.write("Sorry, API returned an error. Check server logs or ensure the Colab server is running.")
+            except requests.exceptions.ConnectionError:
+                st.error(f"❌ Cannot connect to Ollama server at {client.host}. Ensure the Colab server is running and the ngrok URL is valid.")
+            except requests.exceptions.Timeout:
+                st.error(f"❌ Request to {client.host} timed out. The server might be slow or offline.")
+            except Exception as e:
+                st.error(f"Error: {str(e)}")
+
+# --------- Export ----------
+def export_controls(key, user_id, scope, date_from=None, date_to=None, search=""):
+    # The file is only built when "Prepare" is clicked, streamed from SQL into a
+    # temp file; plain reruns never touch the rows.
+    c1, c2 = st.columns([1, 2])
+    fmt = c1.selectbox("Export format", list(exporter.FORMATS), key=f"{key}_export_fmt", label_visibility="collapsed")
+    if c2.button("Prepare download", key=f"{key}_export_btn"):
+        try:
+            st.session_state[f"{key}_export"] = (fmt, exporter.export_to_tempfile(user_id, scope, fmt, date_from, date_to, search))
+        except RuntimeError as e:
+            st.error(str(e))
+    prepared = st.session_state.get(f"{key}_export")
+    if prepared:
+        fmt, data = prepared
+        data.seek(0)
+        st.download_button(f"Download {exporter.file_name(scope, fmt)}", data=data,
+                           file_name=exporter.file_name(scope, fmt), mime=exporter.FORMATS[fmt][1], key=f"{key}_export_dl")
+
+# --------- History Pagination ----------
+@instrument.timed("view.history_page")
+def history_page(key, user_id, table, date_from, date_to, search):
+    # Only the visible page is loaded (and gets edit controls); the cursor stack
+    # in session_state remembers where each earlier page started for "Prev".
+    # "Best match" ranks full-text hits and pages by offset; the cursors are offsets then.
+    c1, c2 = st.columns(2)
+    # Ranking only means something with search words; without them keyset paging applies.
+    sort_options = ["Newest first", "Oldest first"] + (["Best match"] if search.strip() and db.has_fts() else [])
+    sort = c1.radio("Sort", sort_options, horizontal=True, key=f"{key}_sort")
+    page_size = c2.selectbox("Rows per page", PAGE_SIZES, index=1, key=f"{key}_size")
+    filters = (str(date_from), str(date_to), search.strip(), sort, page_size)
+    if st.session_state.get(f"{key}_filters") != filters:
+        st.session_state[f"{key}_filters"] = filters
+        st.session_state[f"{key}_cursors"] = [None]
+    cursors = st.session_state[f"{key}_cursors"]
+    total = count_history(user_id, table, date_from, date_to, search)
+    if sort == "Best match":
+        page_df = search_history(user_id, table, search, date_from, date_to,
+                                 limit=page_size, offset=cursors[-1] or 0)
+    else:
+        page_df = get_history_page(user_id, table, date_from, date_to, search,
+                                   after=cursors[-1], limit=page_size, descending=sort == "Newest first")
+    pages = max(1, -(-total // page_size))
+    c1, c2, c3 = st.columns([1, 2, 1])
+    if c1.button("◀ Prev", key=f"{key}_prev", disabled=len(cursors) == 1):
+        cursors.pop()
+        st.rerun()
+    c2.caption(f"Page {len(cursors)} of {pages} · {total} rows")
+    if c3.button("Next ▶", key=f"{key}_next", disabled=len(cursors) >= pages or page_df.empty):
+        last = page_df.iloc[-1]
+        cursors.append(len(cursors) * page_size if sort == "Best match" else (last['date'], int(last['id'])))
+        st.rerun()
+    return page_df
+
+# --------- Batched Edits ----------
+# Save/Delete (and the bulk editor) only queue changes in session_state; "Apply"
+# writes the whole queue in one transaction and reruns once. Each applied batch
+# can be undone.
+def pending_changes(key):
+    # row id -> ("update", (amount, category|source, note, date)) or ("delete", None)
+    return st.session_state.setdefault(f"{key}_pending", {})
+
+def bulk_editor(key, table, page_df, pending):
+    column = db.GROUP_COLUMNS[table]
+    config = {"delete": st.column_config.CheckboxColumn("Delete")}
+    if table == "expenses":
+        config[column] = st.column_config.SelectboxColumn("category", options=EXPENSE_CATEGORIES)
+    # Show what is already queued for these rows (from the per-row expanders or
+    # an earlier rerun), so a row the editor leaves alone keeps its queued change.
+    seeded = page_df.assign(delete=False)
+    for i, row_id in enumerate(page_df['id']):
+        op, values = pending.get(int(row_id), (None, None))
+        if op == "delete":
+            seeded.loc[seeded.index[i], 'delete'] = True
+        elif op == "update":
+            seeded.loc[seeded.index[i], ['amount', column, 'note', 'date']] = list(values)
+    # Keyed by the page's rows so an edit never carries over to another page.
+    edited = st.data_editor(seeded, column_config=config, disabled=["id"],
+                            column_order=["delete", "amount", column, "note", "date", "id"],
+                            hide_index=True, use_container_width=True,
+                            key=f"{key}_editor_{page_df['id'].iloc[0]}_{page_df['id'].iloc[-1]}")
+    for (_, old), (_, new) in zip(page_df.iterrows(), edited.iterrows()):
+        row_id = int(old['id'])
+        values = (float(new['amount']), new[column], new['note'], str(new['date']))
+        if new['delete']:
+            pending[row_id] = ("delete", None)
+        elif values != (float(old['amount']), old[column], old['note'], str(old['date'])):
+            pending[row_id] = ("update", values)
+        else:
+            pending.pop(row_id, None)
+
+def clear_queue(key, pending):
+    pending.clear()
+    for name in [k for k in st.session_state if k.startswith(f"{key}_editor_")]:
+        del st.session_state[name]
+
+def mutation_bar(key, user_id, table, pending):
+    if pending:
+        edits = {row_id: values for row_id, (op, values) in pending.items() if op == "update"}
+        deletes = [row_id for row_id, (op, _) in pending.items() if op == "delete"]
+        st.info(f"{len(edits)} edit(s) and {len(deletes)} delete(s) queued.")
+        c1, c2 = st.columns(2)
+        if c1.button(f"✅ Apply {len(pending)} change(s)", key=f"{key}_apply", type="primary"):
+            try:
+                get_writer().apply_mutations(user_id, table, edits, deletes)
+            except sqlite3.IntegrityError as e:
+                st.error(f"Nothing was saved: {e}")
+            else:
+                clear_queue(key, pending)
+                st.rerun()
+        if c2.button("✖ Discard queued changes", key=f"{key}_discard"):
+            clear_queue(key, pending)
+            st.rerun()
+    last = db.last_batch(user_id, table)
+    if last and st.button(f"↩ Undo last change ({last[1]} row(s), {last[2]})", key=f"{key}_undo"):
+        get_writer().undo_batch(user_id, last[0])
+        st.rerun()
+
+# --------- Dashboard & Views ----------
 def dashboard(user_id):
     if "username" not in st.session_state:
         st.warning("Session expired. Please log in again.")
         st.session_state.page = "login"
         return
 
-    tab_dashboard, tab_expenses, tab_income, tab_reports, tab_ai = st.tabs(
-        ["🏠 Dashboard", "🧾 Expenses", "💵 Income", "📊 Reports", "🤖 AI Chatbot"]
-    )
+    # Only the selected view runs on a rerun (st.tabs would evaluate all five).
+    view = st.radio("View", VIEWS, horizontal=True, key="view", label_visibility="collapsed")
 
     with st.sidebar:
         st.markdown(f"""
@@ -258,6 +337,11 @@ def dashboard(user_id):
         👋 <b>Hello, {st.session_state['username']}!</b>
         </div>
         """, unsafe_allow_html=True)
+        st.markdown("**Export whole account**")
+        export_controls("acct", user_id, "all")
+        if st.session_state['username'] in instrument.ADMINS:
+            with st.expander("🛠 Diagnostics"):
+                diagnostics_panel()
         if st.button("Logout", use_container_width=True):
             for key in list(st.session_state.keys()):
                 del st.session_state[key]
@@ -265,11 +349,8 @@ def dashboard(user_id):
             st.session_state.page = "login"
             st.stop()
 
-    with tab_dashboard:
-        income_df = get_income(user_id)
-        exp_df = get_expenses(user_id)
-        total_income = income_df['amount'].sum() if not income_df.empty else 0
-        total_expense = exp_df['amount'].sum() if not exp_df.empty else 0
+    if view == "🏠 Dashboard":
+        total_income, total_expense = get_totals(user_id)
         balance = total_income - total_expense
         col1, col2, col3 = st.columns(3)
         col1.metric("Total Income", f"₹{total_income:,.2f}")
@@ -282,14 +363,14 @@ def dashboard(user_id):
             with st.form("add_expense_form"):
                 st.markdown("#### Add Expense")
                 amount = st.number_input("Expense Amount", min_value=0.01, step=0.01, key="e_amt")
-                category = st.selectbox("Category", ["Food", "Shopping", "Transport", "Others"], key="e_cat")
+                category = st.selectbox("Category", EXPENSE_CATEGORIES, key="e_cat")
                 note = st.text_input("Note", key="e_note")
                 date = st.date_input("Date", key="e_date", value=datetime.now())
                 submitted = st.form_submit_button("Add Expense", type="primary")
                 if submitted:
-                    add_expense(user_id, amount, category, note, str(date))
+                    get_writer().add_expense(user_id, amount, category, note, str(date))
                     st.success("Expense Added!")
-                    st.experimental_rerun()
+                    st.rerun()
         with c2:
             with st.form("add_income_form"):
                 st.markdown("#### Add Income")
@@ -299,115 +380,152 @@ def dashboard(user_id):
                 date = st.date_input("Date", key="i_date", value=datetime.now())
                 submitted = st.form_submit_button("Add Income", type="primary")
                 if submitted:
-                    add_income(user_id, amount, source, note, str(date))
+                    get_writer().add_income(user_id, amount, source, note, str(date))
                     st.success("Income Added!")
-                    st.experimental_rerun()
+                    st.rerun()
+        with st.expander("📥 Import bank statement (CSV / OFX)"):
+            uploaded = st.file_uploader("Statement file", type=["csv", "ofx", "qfx"], key="import_file")
+            kind = st.radio("Import as", ["auto", "expenses", "income"], horizontal=True, key="import_kind",
+                            help="auto: debits/negative amounts become expenses, credits become income")
+            date_format = st.selectbox("Date format", [None] + importer.DATE_FORMATS, key="import_date_format",
+                                       format_func=lambda fmt: "Detect" if fmt is None else importer.format_label(fmt),
+                                       help="Pick one when every date could be read either way (e.g. 01/02/2024)")
+            if uploaded is not None and st.button("Import", type="primary", key="import_btn"):
+                status = st.empty()
+                try:
+                    stats = importer.import_upload(user_id, uploaded, kind,
+                                                   progress=lambda read, rate: status.info(f"{read:,} rows read ({rate:,.0f} rows/s)..."),
+                                                   writer=get_writer(), date_format=date_format)
+                except importer.RowError as e:
+                    st.error(f"Could not import: {e}")
+                else:
+                    status.success(f"Imported {stats['inserted']:,} rows, skipped {stats['duplicates']:,} duplicates, "
+                                   f"rejected {stats['rejected']:,} ({stats['rows_per_sec']:,.0f} rows/s).")
+                    for line_no, error in stats["errors"]:
+                        st.caption(f"Line {line_no}: {error}")
 
-    with tab_expenses:
+    elif view == "🧾 Expenses":
         st.markdown("### Expenses History")
-        exp_df = get_expenses(user_id)
-        if not exp_df.empty:
+        first_date, last_date = get_date_bounds(user_id, "expenses")
+        if first_date is not None:
             search = st.text_input("Search by Note or Category", key="exp_search")
-            date_from = st.date_input("From", pd.to_datetime(exp_df['date'].min()), key="exp_from_d")
-            date_to = st.date_input("To", pd.to_datetime(exp_df['date'].max()), key="exp_to_d")
-            filtered_df = exp_df[
-                exp_df['date'].between(str(date_from), str(date_to)) & (
-                    exp_df['note'].str.contains(search, case=False, na=False) |
-                    exp_df['category'].str.contains(search, case=False, na=False)
-                )
-            ] if search.strip() else exp_df[exp_df['date'].between(str(date_from), str(date_to))]
-            st.download_button("Download as CSV", data=filtered_df.to_csv(index=False).encode(), file_name='expenses.csv')
-            st.dataframe(filtered_df.sort_values("date", ascending=False), use_container_width=True, hide_index=True)
-            for idx, row in filtered_df.iterrows():
+            date_from = st.date_input("From", datetime.fromisoformat(first_date), key="exp_from_d")
+            date_to = st.date_input("To", datetime.fromisoformat(last_date), key="exp_to_d")
+            export_controls("exp", user_id, "expenses", date_from, date_to, search)
+            page_df = history_page("exp", user_id, "expenses", date_from, date_to, search)
+            pending = pending_changes("exp")
+            bulk = st.toggle("Bulk edit", key="exp_bulk") and not page_df.empty
+            if bulk:
+                bulk_editor("exp", "expenses", page_df, pending)
+            else:
+                st.dataframe(page_df, use_container_width=True, hide_index=True)
+            for idx, row in ([] if bulk else page_df.iterrows()):
                 with st.expander(f"Edit/Delete ₹{row['amount']:.2f} | {row['category']} | {row['date']}", expanded=False):
                     new_amt = st.number_input("Amount", value=float(row['amount']), key=f"ed_amt_{row['id']}")
-                    new_cat = st.selectbox("Category", ["Food", "Shopping", "Transport", "Others"],
-                                           index=["Food", "Shopping", "Transport", "Others"].index(row['category']),
+                    new_cat = st.selectbox("Category", EXPENSE_CATEGORIES,
+                                           index=EXPENSE_CATEGORIES.index(row['category']),
                                            key=f"ed_cat_{row['id']}")
                     new_note = st.text_input("Note", value=row['note'], key=f"ed_note_{row['id']}")
-                    new_dt = st.date_input("Date", pd.to_datetime(row['date']), key=f"ed_date_{row['id']}")
+                    new_dt = st.date_input("Date", datetime.fromisoformat(row['date']), key=f"ed_date_{row['id']}")
                     c1, c2 = st.columns(2)
                     if c1.button("📝 Save Edit", key=f"ed_save_{row['id']}", type="primary"):
-                        update_expense(row['id'], new_amt, new_cat, new_note, str(new_dt))
-                        st.success("Updated!")
-                        st.experimental_rerun()
+                        pending[int(row['id'])] = ("update", (new_amt, new_cat, new_note, str(new_dt)))
+                        st.success("Edit queued.")
                     if c2.button("🗑️ Delete", key=f"ed_del_{row['id']}", type="primary"):
-                        delete_expense(row['id'])
-                        st.success("Deleted!")
-                        st.experimental_rerun()
+                        pending[int(row['id'])] = ("delete", None)
+                        st.success("Delete queued.")
+            mutation_bar("exp", user_id, "expenses", pending)
         else:
             st.info("No expenses yet.")
 
-    with tab_income:
+    elif view == "💵 Income":
         st.markdown("### Income History")
-        inc_df = get_income(user_id)
-        if not inc_df.empty:
+        first_date, last_date = get_date_bounds(user_id, "income")
+        if first_date is not None:
             search = st.text_input("Search by Note or Source", key="inc_search")
-            date_from = st.date_input("From", pd.to_datetime(inc_df['date'].min()), key="inc_from_d")
-            date_to = st.date_input("To", pd.to_datetime(inc_df['date'].max()), key="inc_to_d")
-            filtered_df = inc_df[
-                inc_df['date'].between(str(date_from), str(date_to)) & (
-                    inc_df['note'].str.contains(search, case=False, na=False) |
-                    inc_df['source'].str.contains(search, case=False, na=False)
-                )
-            ] if search.strip() else inc_df[inc_df['date'].between(str(date_from), str(date_to))]
-            st.download_button("Download as CSV", data=filtered_df.to_csv(index=False).encode(), file_name='income.csv')
-            st.dataframe(filtered_df.sort_values("date", ascending=False), use_container_width=True, hide_index=True)
-            for idx, row in filtered_df.iterrows():
+            date_from = st.date_input("From", datetime.fromisoformat(first_date), key="inc_from_d")
+            date_to = st.date_input("To", datetime.fromisoformat(last_date), key="inc_to_d")
+            export_controls("inc", user_id, "income", date_from, date_to, search)
+            page_df = history_page("inc", user_id, "income", date_from, date_to, search)
+            pending = pending_changes("inc")
+            bulk = st.toggle("Bulk edit", key="inc_bulk") and not page_df.empty
+            if bulk:
+                bulk_editor("inc", "income", page_df, pending)
+            else:
+                st.dataframe(page_df, use_container_width=True, hide_index=True)
+            for idx, row in ([] if bulk else page_df.iterrows()):
                 with st.expander(f"Edit/Delete ₹{row['amount']:.2f} | {row['source']} | {row['date']}", expanded=False):
                     new_amt = st.number_input("Amount", value=float(row['amount']), key=f"ed_inc_amt_{row['id']}")
                     new_src = st.text_input("Source", value=row['source'], key=f"ed_inc_src_{row['id']}")
                     new_note = st.text_input("Note", value=row['note'], key=f"ed_inc_note_{row['id']}")
-                    new_dt = st.date_input("Date", pd.to_datetime(row['date']), key=f"ed_inc_date_{row['id']}")
+                    new_dt = st.date_input("Date", datetime.fromisoformat(row['date']), key=f"ed_inc_date_{row['id']}")
                     c1, c2 = st.columns(2)
                     if c1.button("📝 Save Edit", key=f"ed_inc_save_{row['id']}", type="primary"):
-                        update_income(row['id'], new_amt, new_src, new_note, str(new_dt))
-                        st.success("Updated!")
-                        st.experimental_rerun()
+                        pending[int(row['id'])] = ("update", (new_amt, new_src, new_note, str(new_dt)))
+                        st.success("Edit queued.")
                     if c2.button("🗑️ Delete", key=f"ed_inc_del_{row['id']}", type="primary"):
-                        delete_income(row['id'])
-                        st.success("Deleted!")
-                        st.experimental_rerun()
+                        pending[int(row['id'])] = ("delete", None)
+                        st.success("Delete queued.")
+            mutation_bar("inc", user_id, "income", pending)
         else:
             st.info("No income yet.")
 
-    with tab_reports:
+    elif view == "📊 Reports":
         reports_tab(user_id)
-    with tab_ai:
+    elif view == "🤖 AI Chatbot":
         advisor_tab(user_id)
 
-# --------- Reports Tab (unchanged) ----------
+# --------- Reports ----------
 def reports_tab(user_id):
     st.header("📊 Advanced Analytics & Reports")
-    exp_df = get_expenses(user_id)
-    inc_df = get_income(user_id)
-    if exp_df.empty:
+    # With a DuckDB snapshot, the range and the charts both come from the snapshot.
+    as_of = analytics.as_of()
+    if as_of:
+        st.caption(f"Charts use the analytics snapshot from {datetime.fromtimestamp(as_of):%Y-%m-%d %H:%M}; "
+                   f"changes made since then are not included.")
+    first_date, last_date = reports.report_bounds(user_id, as_of)
+    if first_date is None:
         st.info("No expenses to show.")
         return
-    st.subheader("Expenses by Category (Pie Chart)")
-    cat_grouped = exp_df.groupby("category", as_index=False)["amount"].sum()
-    fig_pie = px.pie(cat_grouped, names="category", values="amount", title="Expenses by Category",
-                     color_discrete_sequence=px.colors.sequential.RdBu, hole=0.35)
-    fig_pie.update_traces(marker=dict(line=dict(color='#fff', width=2)), textinfo="percent+label+value")
-    st.plotly_chart(fig_pie, use_container_width=True)
-    st.subheader("Top Spending Categories (Bar Chart)")
-    bar = px.bar(cat_grouped.sort_values('amount'), x='amount', y='category', orientation='h',
-                 labels={'amount': 'Total Spent', 'category': 'Category'}, color='amount',
-                 color_continuous_scale='Aggrnyl')
-    st.plotly_chart(bar, use_container_width=True)
-    st.subheader("Month-wise Trends")
-    exp_df['month'] = pd.to_datetime(exp_df['date']).dt.to_period('M').astype(str)
-    exp_trend = exp_df.groupby('month', as_index=False)['amount'].sum()
-    fig_line = px.line(exp_trend, x='month', y='amount', markers=True, title='Monthly Expenses Trend', line_shape='spline')
-    st.plotly_chart(fig_line, use_container_width=True)
-    if not inc_df.empty:
-        inc_df['month'] = pd.to_datetime(inc_df['date']).dt.to_period('M').astype(str)
-        inc_trend = inc_df.groupby('month', as_index=False)['amount'].sum()
-        fig_inc_line = px.line(inc_trend, x='month', y='amount', markers=True, title='Monthly Income Trend', line_shape='spline')
-        st.plotly_chart(fig_inc_line, use_container_width=True)
-
-# --------- MAIN ROUTER (unchanged) ----------
-def main():
+    c1, c2 = st.columns(2)
+    date_from = c1.date_input("From", datetime.fromisoformat(first_date), key="rep_from_d")
+    date_to = c2.date_input("To", datetime.fromisoformat(last_date), key="rep_to_d")
+    # The full range reads the monthly summaries; anything narrower hits the indexes.
+    if (str(date_from), str(date_to)) == (first_date, last_date):
+        date_from = date_to = None
+    figures = reports.figure_specs(user_id, date_from, date_to, as_of)
+    if not figures:
+        st.info("No expenses to show.")
+        return
+    for subheader, figure in figures:
+        if subheader:
+            st.subheader(subheader)
+        st.plotly_chart(figure, use_container_width=True)
+
+# --------- Diagnostics (admins only) ----------
+def diagnostics_panel():
+    if st.button("Profile next rerun", key="diag_profile"):
+        st.session_state["profile_next"] = True
+    if not instrument.ENABLED:
+        st.caption("Timings are off; start the app with TRACKER_METRICS=1 to collect them.")
+    else:
+        stats = instrument.snapshot()
+        st.dataframe([{"op": name, "calls": s["count"], "mean ms": round(s["mean"] * 1000, 2),
+                       "max ms": round(s["max"] * 1000, 2), "total s": round(s["seconds"], 3),
+                       "rows": s["rows"], "errors": s["errors"]}
+                      for name, s in sorted(stats.items(), key=lambda item: -item[1]["seconds"])],
+                     use_container_width=True, hide_index=True)
+        c1, c2, c3 = st.columns(3)
+        c1.download_button("metrics.prom", instrument.prometheus(stats), file_name="metrics.prom", key="diag_prom")
+        c2.download_button("metrics.jsonl", instrument.jsonl(stats), file_name="metrics.jsonl", key="diag_jsonl")
+        if c3.button("Reset", key="diag_reset"):
+            instrument.reset()
+    st.caption("Query cache: " + ", ".join(f"{k} {v:,.2f}" if isinstance(v, float) else f"{k} {v:,}"
+                                           for k, v in query_cache.stats().items()))
+    st.caption("Advisor cache: " + ", ".join(f"{k} {v:,}" for k, v in advisor.response_cache.stats().items()))
+
+# --------- Main Router ----------
+def route():
     if "page" not in st.session_state:
         st.session_state.page = "login"
     if "username" in st.session_state:
@@ -418,11 +536,12 @@ def main():
         register_screen()
     elif st.session_state.page == "dashboard":
         if "username" in st.session_state:
-            user_id = get_user_id(st.session_state["username"])
+            user_id = session_user_id()
             if user_id:
-                dashboard(user_id)
+                with instrument.span(VIEW_METRICS.get(st.session_state.get("view"), "view.dashboard")):
+                    dashboard(user_id)
             else:
-                st.error("User does not exist. Please log in again.")
+                st.error("Your session has expired. Please log in again.")
                 for key in list(st.session_state.keys()):
                     del st.session_state[key]
                 st.session_state.page = "login"
@@ -434,5 +553,17 @@ def main():
         st.session_state.page = "login"
         login_screen()
 
+def main():
+    get_pool()
+    get_metrics_server()
+    # "Profile next rerun" in the diagnostics panel captures exactly one rerun.
+    if st.session_state.pop("profile_next", False):
+        _, report = instrument.profile(route)
+        with st.expander("⏱ Profile of this rerun", expanded=True):
+            st.code(report)
+    else:
+        with instrument.span("rerun"):
+            route()
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
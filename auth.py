@@ -0,0 +1,198 @@
+import argparse
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+
+import db
+import instrument
+
+# Password hashing and sessions. bcrypt runs in a small process pool so a burst
+# of logins can't take the CPU from every other session's script thread; hashes
+# made with an older cost are upgraded on the next successful login. After
+# login the user id lives in a signed session token, so reruns never query the
+# users table. Failed attempts are throttled per username.
+
+BCRYPT_ROUNDS = int(os.getenv("TRACKER_BCRYPT_ROUNDS", "12"))
+# 0 hashes on the calling thread (no worker processes).
+WORKERS = int(os.getenv("TRACKER_AUTH_WORKERS", str(min(2, os.cpu_count() or 1))))
+TOKEN_TTL = int(os.getenv("TRACKER_SESSION_TTL", str(12 * 3600)))  # seconds
+# Tokens signed with a per-process key die with the server, like the sessions holding them.
+SECRET = (os.getenv("TRACKER_SECRET") or "").encode() or os.urandom(32)
+MAX_FAILURES = 5
+FAILURE_WINDOW = 300  # seconds
+
+
+class AuthError(Exception):
+    pass
+
+
+class Throttled(AuthError):
+    def __init__(self, retry_after):
+        super().__init__(f"Too many failed attempts. Try again in {int(retry_after) + 1}s.")
+        self.retry_after = retry_after
+
+
+# --------- bcrypt in worker processes ----------
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _pool():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # spawn, not fork: forking the threaded Streamlit server is unsafe.
+                _executor = ProcessPoolExecutor(WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+def _run(fn, *args):
+    if WORKERS <= 0:
+        return fn(*args)
+    return _pool().submit(fn, *args).result()
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds)).decode()
+
+
+def _check(password, hashed):
+    return bcrypt.checkpw(password, hashed)
+
+
+@instrument.timed("auth.hash_password")
+def hash_password(password, rounds=None):
+    return _run(_hash, password.encode(), rounds or BCRYPT_ROUNDS)
+
+
+@instrument.timed("auth.verify_password")
+def verify_password(password, hashed):
+    return _run(_check, password.encode(), hashed.encode())
+
+
+def needs_rehash(hashed, rounds=None):
+    """True when hashed ($2b$<cost>$...) was made with a different cost than configured."""
+    try:
+        return int(hashed.split("$")[2]) != (rounds or BCRYPT_ROUNDS)
+    except (IndexError, ValueError):
+        return True
+
+
+_dummy_hash = None
+
+
+def _dummy():
+    # Unknown usernames still pay for one bcrypt check, so timing doesn't reveal which names exist.
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = hash_password(os.urandom(16).hex())
+    return _dummy_hash
+
+
+# --------- Throttling ----------
+_failures = defaultdict(deque)  # username -> monotonic times of recent failures
+_failures_lock = threading.Lock()
+
+
+def retry_after(username):
+    """Seconds until username may try again, or 0."""
+    now = time.monotonic()
+    with _failures_lock:
+        attempts = _failures.get(username)
+        if not attempts:
+            return 0
+        while attempts and now - attempts[0] > FAILURE_WINDOW:
+            attempts.popleft()
+        if len(attempts) < MAX_FAILURES:
+            return 0
+        return FAILURE_WINDOW - (now - attempts[0])
+
+
+def _record_failure(username):
+    with _failures_lock:
+        attempts = _failures[username]
+        attempts.append(time.monotonic())
+        while len(attempts) > MAX_FAILURES:
+            attempts.popleft()
+
+
+# --------- Login ----------
+def login(username, password, writer=db):
+    """Check credentials; returns the user id, or None when they are wrong. Raises Throttled.
+
+    A hash upgrade is written with writer (db or a backend.BackendClient).
+    """
+    wait = retry_after(username)
+    if wait:
+        raise Throttled(wait)
+    row = db.query_one("SELECT id, password_hash FROM users WHERE username=?", (username,))
+    if row is None:
+        verify_password(password, _dummy())
+        _record_failure(username)
+        return None
+    user_id, hashed = row
+    if not verify_password(password, hashed):
+        _record_failure(username)
+        return None
+    with _failures_lock:
+        _failures.pop(username, None)
+    if needs_rehash(hashed):
+        writer.update_password_hash(user_id, hash_password(password), hashed)
+    return user_id
+
+
+# --------- Session tokens ----------
+def _sign(payload):
+    return base64.urlsafe_b64encode(hmac.new(SECRET, payload.encode(), hashlib.sha256).digest()).decode().rstrip("=")
+
+
+def issue_token(user_id, username, ttl=TOKEN_TTL):
+    """'user_id:username:expires:signature' for session_state; checked without the database."""
+    payload = f"{user_id}:{base64.urlsafe_b64encode(username.encode()).decode()}:{int(time.time() + ttl)}"
+    return f"{payload}:{_sign(payload)}"
+
+
+def read_token(token):
+    """(user_id, username) from a valid, unexpired token, else None."""
+    try:
+        user_id, name, expires, signature = token.split(":")
+        payload = f"{user_id}:{name}:{expires}"
+        if not hmac.compare_digest(signature, _sign(payload)) or int(expires) < time.time():
+            return None
+        return int(user_id), base64.urlsafe_b64decode(name).decode()
+    except (AttributeError, ValueError):
+        return None
+
+
+def calibrate(target=0.25, rounds_range=range(10, 15)):
+    """[(rounds, seconds)] for one hash at each cost, and the highest cost within target seconds."""
+    timings = []
+    for rounds in rounds_range:
+        started = time.perf_counter()
+        _hash(b"calibrate", rounds)
+        timings.append((rounds, time.perf_counter() - started))
+    fitting = [rounds for rounds, seconds in timings if seconds <= target]
+    return timings, (fitting[-1] if fitting else rounds_range[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time bcrypt costs to pick TRACKER_BCRYPT_ROUNDS.")
+    parser.add_argument("--target", type=float, default=0.25, help="seconds per login hash (default: %(default)s)")
+    args = parser.parse_args()
+    timings, best = calibrate(args.target)
+    for rounds, seconds in timings:
+        print(f"cost {rounds}: {seconds * 1000:.0f} ms")
+    print(f"Suggested TRACKER_BCRYPT_ROUNDS={best}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+import argparse
+import functools
+import hmac
+import json
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+import db
+import instrument
+from db_init import migrate
+
+# Local backend service for running several Streamlit processes against one
+# tracker.db. It exposes the db.py operations as a small JSON API:
+#
+#   python backend.py --port 8765
+#   TRACKER_BACKEND=http://localhost:8765 streamlit run app.py --server.port 8501
+#   TRACKER_BACKEND=http://localhost:8765 streamlit run app.py --server.port 8502
+#
+#   POST /api/<operation>  {"args": [...], "kwargs": {...}}  ->  {"result": ...}
+#
+# Every write is handed to one writer thread, so SQLite sees a single writer
+# no matter how many frontends there are and never has to retry on
+# SQLITE_BUSY. Reads are served concurrently from the connection pool.
+# Frontends send their writes here and keep reading the WAL database directly.
+
+BACKEND_URL = os.getenv("TRACKER_BACKEND", "")
+TOKEN = os.getenv("TRACKER_BACKEND_TOKEN", "")  # optional shared secret (X-Tracker-Token)
+QUEUE_SIZE = 1000
+
+READS = ("data_version", "get_totals", "get_group_totals", "get_monthly_totals", "get_top_groups",
+         "get_recent_months", "get_year_over_year", "get_date_bounds", "count_history", "get_history_page",
+         "search_history", "last_batch", "import_watermark")
+WRITES = ("create_user", "update_password_hash", "add_expense", "add_income", "update_expense",
+          "update_income", "delete_expense", "delete_income", "apply_mutations", "undo_batch", "import_batch",
+          "save_llm_response")
+
+
+class BackendError(Exception):
+    def __init__(self, message, status=500):
+        super().__init__(message)
+        self.status = status
+
+
+# --------- Wire format ----------
+def _encode(value):
+    if hasattr(value, "to_dict") and hasattr(value, "columns"):
+        return {"__frame__": list(value.columns), "rows": value.astype(object).values.tolist()}
+    if hasattr(value, "item"):  # numpy scalar
+        return value.item()
+    return str(value)  # dates
+
+
+def _decode(value):
+    if isinstance(value, dict) and "__frame__" in value:
+        import pandas as pd
+        return pd.DataFrame(value["rows"], columns=value["__frame__"])
+    return value
+
+
+def _dumps(value):
+    return json.dumps(value, default=_encode).encode()
+
+
+# --------- Single writer ----------
+class Writer:
+    def __init__(self, size=QUEUE_SIZE):
+        self.jobs = queue.Queue(size)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, fn, args, kwargs):
+        future = Future()
+        try:
+            self.jobs.put_nowait((fn, args, kwargs, future))
+        except queue.Full:
+            raise BackendError("Write queue is full, try again.", 503)
+        return future
+
+    def _run(self):
+        while True:
+            fn, args, kwargs, future = self.jobs.get()
+            with instrument.span("backend.write"):
+                try:
+                    future.set_result(fn(*args, **kwargs))
+                except Exception as e:
+                    future.set_exception(e)
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive for pooled clients
+    disable_nagle_algorithm = True  # headers and body go out as separate writes
+    writer = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send(200, _dumps({"ok": True, "queued": self.writer.jobs.qsize()}))
+        elif self.path == "/metrics":
+            self._send(200, instrument.prometheus().encode(), "text/plain; version=0.0.4")
+        else:
+            self._send(404, _dumps({"error": "Not found"}))
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        op = self.path.removeprefix("/api/")
+        if TOKEN and not hmac.compare_digest(self.headers.get("X-Tracker-Token", "").encode(), TOKEN.encode()):
+            self._send(401, _dumps({"error": "Bad token"}))
+            return
+        if op not in READS and op not in WRITES:
+            self._send(404, _dumps({"error": f"Unknown operation: {op}"}))
+            return
+        try:
+            request = json.loads(body or b"{}")
+            args, kwargs = request.get("args", []), request.get("kwargs", {})
+            with instrument.span(f"backend.{op}"):
+                if op in WRITES:
+                    result = self.writer.submit(getattr(db, op), args, kwargs).result()
+                else:
+                    result = getattr(db, op)(*args, **kwargs)
+            self._send(200, _dumps({"result": result}))
+        except BackendError as e:
+            self._send(e.status, _dumps({"error": str(e)}))
+        except sqlite3.IntegrityError as e:
+            self._send(409, _dumps({"error": str(e)}))
+        except (TypeError, ValueError) as e:
+            self._send(400, _dumps({"error": str(e)}))
+        except Exception as e:
+            self._send(500, _dumps({"error": f"{type(e).__name__}: {e}"}))
+
+
+def serve(host="127.0.0.1", port=8765, queue_size=QUEUE_SIZE):
+    """Start the API in a daemon thread; returns the server (server_address has the bound port)."""
+    handler = type("BoundHandler", (Handler,), {"writer": Writer(queue_size)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# --------- Client ----------
+class BackendClient:
+    """Calls the backend with the same names and arguments as the db functions, e.g. client.add_expense(...)."""
+
+    def __init__(self, url=BACKEND_URL, token=TOKEN, timeout=30.0):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        if token:
+            self.session.headers["X-Tracker-Token"] = token
+
+    def call(self, op, *args, **kwargs):
+        response = self.session.post(f"{self.url}/api/{op}", data=_dumps({"args": args, "kwargs": kwargs}),
+                                     headers={"Content-Type": "application/json"}, timeout=self.timeout)
+        body = response.json()
+        if response.status_code == 409:
+            raise sqlite3.IntegrityError(body["error"])  # same as a local write would raise
+        if response.status_code != 200:
+            raise BackendError(body.get("error", response.text), response.status_code)
+        return _decode(body["result"])
+
+    def __getattr__(self, op):
+        if op in READS or op in WRITES:
+            return functools.partial(self.call, op)
+        raise AttributeError(op)
+
+    def close(self):
+        self.session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the tracker database as a local JSON API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--db", default=db.DB_PATH, help="database file (default: %(default)s)")
+    parser.add_argument("--queue", type=int, default=QUEUE_SIZE, help="max writes waiting for the writer")
+    args = parser.parse_args()
+
+    pool = db.configure(args.db)
+    with pool.connection() as conn:
+        migrate(conn)
+    server = serve(args.host, args.port, args.queue)
+    print(f"Serving {args.db} on http://{args.host}:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,394 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import bcrypt
+
+import db
+import exporter
+import summaries
+from cache import query_cache
+from db_init import migrate
+
+# Benchmark harness: builds synthetic tracker databases at several sizes and
+# times the real data-access, report and write paths against them, plus a
+# headless run of every view through Streamlit's AppTest. Results go to JSON
+# so two commits can be compared:
+#
+#   python bench.py --sizes 1k,100k --json before.json
+#   python bench.py --sizes 1k,100k --json after.json --compare before.json
+#
+# Datasets are cached under --data-dir and reused while size, users and seed match.
+
+SIZES = {"1k": (1_000, 10), "100k": (100_000, 1_000), "1M": (1_000_000, 2_000), "10M": (10_000_000, 10_000)}
+INCOME_SHARE = 0.1  # one income row for every nine expenses
+YEARS = 3
+BATCH = 50_000
+PASSWORD = "bench123"  # every synthetic user shares it
+
+# category: (weight, median amount, merchants that end up in the note)
+CATEGORIES = {
+    "Food": (0.45, 250, ["UPI-SWIGGY ORDER", "ZOMATO", "BIGBASKET", "DMART GROCERY", "CAFE COFFEE DAY"]),
+    "Transport": (0.25, 180, ["UBER TRIP", "OLA CABS", "IRCTC TICKET", "HPCL FUEL", "METRO CARD RECHARGE"]),
+    "Shopping": (0.20, 1200, ["AMAZON", "FLIPKART", "MYNTRA", "CROMA", "DECATHLON"]),
+    "Others": (0.10, 800, ["ELECTRICITY BILL", "JIO RECHARGE", "RENT TRANSFER", "PHARMACY", "GYM MEMBERSHIP"]),
+}
+SOURCES = {
+    # source: (weight, median amount)
+    "Salary": (0.55, 65000),
+    "Freelance": (0.20, 12000),
+    "Interest": (0.15, 900),
+    "Refund": (0.10, 700),
+}
+
+
+def parse_size(text):
+    """'100k' -> (100000, default users); plain numbers and k/M suffixes are accepted."""
+    if text in SIZES:
+        return SIZES[text]
+    scale = {"k": 1_000, "m": 1_000_000}.get(text[-1].lower(), 1)
+    rows = int(float(text[:-1] if scale > 1 else text) * scale)
+    return rows, max(10, min(10_000, rows // 100))
+
+
+# --------- Synthetic data ----------
+def _user_weights(users):
+    # A few heavy users and a long tail of light ones (Zipf-like).
+    return [1 / (rank ** 0.8) for rank in range(1, users + 1)]
+
+
+def _random_date(rng, start, days):
+    # Recent months are busier than older ones.
+    offset = int(days * (1 - rng.random() ** 1.5))
+    return (start + datetime.timedelta(days=min(offset, days - 1))).isoformat()
+
+
+def _rows(rng, count, users, weights, start, days):
+    user_ids = rng.choices(range(1, users + 1), weights=weights, k=count)
+    cat_names = list(CATEGORIES)
+    cat_weights = [CATEGORIES[name][0] for name in cat_names]
+    src_names = list(SOURCES)
+    src_weights = [SOURCES[name][0] for name in src_names]
+    for user_id in user_ids:
+        date = _random_date(rng, start, days)
+        if rng.random() < INCOME_SHARE:
+            source = rng.choices(src_names, src_weights)[0]
+            amount = round(rng.lognormvariate(0, 0.4) * SOURCES[source][1], 2)
+            yield "income", (user_id, amount, source, f"{source.upper()} CREDIT", date)
+        else:
+            category = rng.choices(cat_names, cat_weights)[0]
+            _, median, merchants = CATEGORIES[category]
+            amount = round(rng.lognormvariate(0, 0.8) * median, 2)
+            yield "expenses", (user_id, amount, category, rng.choice(merchants), date)
+
+
+def generate(path, rows, users, seed=42):
+    """Create a migrated tracker database at path with users and rows of expenses + income."""
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    migrate(conn)
+    hashed = bcrypt.hashpw(PASSWORD.encode(), bcrypt.gensalt(rounds=4)).decode()
+    conn.execute("BEGIN")
+    conn.executemany("INSERT INTO users (username, password_hash, email) VALUES (?, ?, ?)",
+                     ((f"user{i}", hashed, f"user{i}@example.com") for i in range(1, users + 1)))
+    # Per-row triggers (summaries, FTS, versions) would dominate a bulk load: drop
+    # them, load, then recreate them and rebuild what they maintain.
+    triggers = conn.execute("SELECT name, sql FROM sqlite_master WHERE type='trigger' "
+                            "AND tbl_name IN ('expenses', 'income')").fetchall()
+    for name, _ in triggers:
+        conn.execute(f"DROP TRIGGER {name}")
+    today = datetime.date.today()
+    start, days = today - datetime.timedelta(days=365 * YEARS), 365 * YEARS
+    batches = {"expenses": [], "income": []}
+    sql = {"expenses": "INSERT INTO expenses (user_id, amount, category, note, date) VALUES (?, ?, ?, ?, ?)",
+           "income": "INSERT INTO income (user_id, amount, source, note, date) VALUES (?, ?, ?, ?, ?)"}
+    for table, row in _rows(rng, rows, users, _user_weights(users), start, days):
+        batch = batches[table]
+        batch.append(row)
+        if len(batch) >= BATCH:
+            conn.executemany(sql[table], batch)
+            batch.clear()
+    for table, batch in batches.items():
+        conn.executemany(sql[table], batch)
+    for _, trigger_sql in triggers:
+        conn.execute(trigger_sql)
+    summaries.rebuild(conn)
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name='expenses_fts'").fetchone():
+        conn.execute("INSERT INTO expenses_fts (expenses_fts) VALUES ('rebuild')")
+        conn.execute("INSERT INTO income_fts (income_fts) VALUES ('rebuild')")
+    conn.execute("COMMIT")
+    conn.execute("ANALYZE")
+    conn.close()
+
+
+def dataset(data_dir, label, rows, users, seed, regenerate=False):
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"tracker-{label}-{users}u-s{seed}.db")
+    if regenerate or not os.path.exists(path):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        started = time.perf_counter()
+        generate(path, rows, users, seed)
+        print(f"generated {label}: {rows:,} rows, {users:,} users in {time.perf_counter() - started:.1f}s")
+    else:
+        conn = sqlite3.connect(path, isolation_level=None)
+        migrate(conn)  # datasets cached by an older commit
+        conn.close()
+    return path
+
+
+# --------- Timing ----------
+def measure(fn, repeat):
+    fn()  # warm-up: statement cache, page cache, lazy imports
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - started)
+    return runs
+
+
+def _result(name, runs, **extra):
+    return {"bench": name, "median": statistics.median(runs), "min": min(runs),
+            "mean": statistics.fmean(runs), "runs": runs, **extra}
+
+
+def _pick_users(user_id_counts):
+    ranked = sorted(user_id_counts, key=lambda item: -item[1])
+    return {"heavy": ranked[0][0], "median": ranked[len(ranked) // 2][0]}
+
+
+def bench_functions(repeat, writes):
+    """Time the data-access and report functions the views call, uncached."""
+    import advisor
+    import reports
+    users = _pick_users(db.query("SELECT user_id, COUNT(*) FROM expenses GROUP BY user_id"))
+    results = []
+    for who, user_id in users.items():
+        first, last = db.get_date_bounds(user_id, "expenses")
+        last_day = datetime.date.fromisoformat(last)
+        month_ago = str(last_day - datetime.timedelta(days=30))
+        page = db.get_history_page(user_id, "expenses", limit=25)
+        cases = [
+            ("get_expenses", lambda: db.get_expenses(user_id), len),
+            ("load_history_arrow", lambda: db.load_history_arrow(user_id), len),
+            ("get_totals", lambda: db.get_totals(user_id), None),
+            ("get_totals.range", lambda: db.get_totals(user_id, month_ago, last), None),
+            ("get_date_bounds", lambda: db.get_date_bounds(user_id, "expenses"), None),
+            ("count_history", lambda: db.count_history(user_id, "expenses"), None),
+            ("count_history.range", lambda: db.count_history(user_id, "expenses", month_ago, last), None),
+            ("count_history.search", lambda: db.count_history(user_id, "expenses", search="swiggy"), None),
+            ("history_page.first", lambda: db.get_history_page(user_id, "expenses", limit=25), len),
+            ("history_page.next", lambda: db.get_history_page(
+                user_id, "expenses", after=(page["date"].iloc[-1], int(page["id"].iloc[-1])), limit=25), len),
+            ("history_page.deep", lambda: db.get_history_page(user_id, "expenses", after=(month_ago, 0), limit=25), len),
+            ("search_history", lambda: db.search_history(user_id, "expenses", "uber", limit=25), len),
+            ("group_totals", lambda: db.get_group_totals(user_id, "expenses"), len),
+            ("group_totals.range", lambda: db.get_group_totals(user_id, "expenses", month_ago, last), len),
+            ("monthly_totals", lambda: db.get_monthly_totals(user_id, "expenses"), len),
+            ("monthly_totals.range", lambda: db.get_monthly_totals(user_id, "expenses", first, month_ago), len),
+            ("reports.build_figures", lambda: reports.build_figures(user_id), len),
+            ("advisor.build_context", lambda: advisor.build_context(user_id), None),
+            ("export.csv", lambda: _export(user_id, "csv"), None),
+        ]
+        for name, fn, count in cases:
+            runs = measure(fn, repeat)
+            extra = {"user": who}
+            if count is not None:
+                extra["rows"] = count(fn())
+            results.append(_result(name, runs, **extra))
+        frame = db.get_expenses(user_id)
+        results.append(_result("frame.monthly_groupby", measure(lambda: frame.groupby("month")["paise"].sum(), repeat),
+                               user=who, rows=len(frame), bytes=int(frame.memory_usage(deep=True).sum())))
+        cached = reports.figure_specs
+        cached(user_id)
+        results.append(_result("reports.figure_specs.cached", measure(lambda: cached(user_id), repeat), user=who))
+    results += _write_throughput(users["median"], writes)
+    return results
+
+
+def _export(user_id, fmt):
+    with tempfile.TemporaryFile() as out:
+        return exporter.export(out, user_id, "expenses", fmt)
+
+
+def _write_throughput(user_id, writes):
+    # Each add is its own transaction, as in the Add Expense form. The rows are
+    # then edited as one queued batch, undone, and removed again.
+    today = str(datetime.date.today())
+    ids = []
+    started = time.perf_counter()
+    for i in range(writes):
+        ids.append(db.add_expense(user_id, 99.0, "Food", f"BENCH {i}", today))
+    seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    batch = db.apply_mutations(user_id, "expenses", {i: (1.0, "Others", "BENCH EDIT", today) for i in ids})
+    batch_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    db.undo_batch(user_id, batch)
+    undo_seconds = time.perf_counter() - started
+    with db.transaction() as conn:
+        conn.executemany("DELETE FROM expenses WHERE id=?", [(i,) for i in ids])
+    return [
+        _result("add_expense", [seconds / writes], user="median", ops_per_sec=writes / seconds),
+        _result("apply_mutations", [batch_seconds / writes], user="median", ops_per_sec=writes / batch_seconds),
+        _result("undo_batch", [undo_seconds / writes], user="median", ops_per_sec=writes / undo_seconds),
+    ]
+
+
+def bench_duckdb(snapshot_dir, repeat):
+    """Time the analytical reads on DuckDB over a Parquet snapshot, next to the same reads on SQLite."""
+    import analytics
+    analytics.snapshot(snapshot_dir)
+    duck = analytics.DuckDBAnalytics(snapshot_dir)
+    users = _pick_users(db.query("SELECT user_id, COUNT(*) FROM expenses GROUP BY user_id"))
+    results = []
+    for who, user_id in users.items():
+        first, last = db.get_date_bounds(user_id, "expenses")
+        for engine_name, engine in (("sqlite", db), ("duckdb", duck)):
+            for name, args in (("get_group_totals", (user_id, "expenses")),
+                               ("get_group_totals.range", (user_id, "expenses", first, last)),
+                               ("get_monthly_totals", (user_id, "expenses")),
+                               ("get_monthly_totals.range", (user_id, "expenses", first, last)),
+                               ("get_year_over_year", (user_id, "expenses"))):
+                fn = getattr(engine, name.split(".")[0])
+                results.append(_result(f"{engine_name}.{name}", measure(lambda: fn(*args), repeat), user=who))
+    return results
+
+
+def bench_views(user_id, username, repeat):
+    """Time headless reruns of every view through AppTest: cold (empty cache) and warm."""
+    import auth
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+    app = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+    st.cache_resource.clear()  # get_pool() must pick up the new database
+    at = AppTest.from_file(app, default_timeout=600)
+    at.session_state["username"] = username
+    at.session_state["auth_token"] = auth.issue_token(user_id, username)
+    at.run()
+    if at.exception:
+        raise RuntimeError(f"app raised: {at.exception[0].value}")
+    results = []
+    for view in ("🏠 Dashboard", "🧾 Expenses", "💵 Income", "📊 Reports"):
+        name = "view." + view.split()[-1].lower()
+        query_cache.invalidate()
+        started = time.perf_counter()
+        at.radio(key="view").set_value(view).run()
+        cold = time.perf_counter() - started
+        if at.exception:
+            raise RuntimeError(f"{view} raised: {at.exception[0].value}")
+        runs = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            at.run()
+            runs.append(time.perf_counter() - started)
+        results.append(_result(name + ".cold", [cold]))
+        results.append(_result(name + ".warm", runs))
+    return results
+
+
+# --------- Reporting ----------
+def metadata():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"commit": commit, "timestamp": time.time(), "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version, "platform": platform.platform()}
+
+
+def compare(results, baseline, threshold, noise=0.001):
+    """Print median ratios against a baseline run; returns the regressions beyond threshold.
+
+    Differences under noise seconds are never flagged: sub-millisecond timings jitter too much.
+    """
+    old = {(r["dataset"], r["bench"], r.get("user")): r["median"] for r in baseline["results"]}
+    regressions = []
+    print(f"\n{'dataset':>8} {'bench':<34} {'user':<7} {'before':>10} {'after':>10} {'ratio':>7}")
+    for r in results:
+        key = (r["dataset"], r["bench"], r.get("user"))
+        if key not in old or not old[key]:
+            continue
+        ratio = r["median"] / old[key]
+        flag = "  REGRESSION" if ratio > threshold and r["median"] - old[key] > noise else ""
+        print(f"{r['dataset']:>8} {r['bench']:<34} {r.get('user') or '':<7} "
+              f"{old[key] * 1000:>8.2f}ms {r['median'] * 1000:>8.2f}ms {ratio:>6.2f}x{flag}")
+        if flag:
+            regressions.append(key)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the tracker against synthetic datasets.")
+    parser.add_argument("--sizes", default="1k,100k",
+                        help="comma-separated row counts, e.g. 1k,100k,10M (default: %(default)s)")
+    parser.add_argument("--users", type=int, help="users per dataset (default: scales with size)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per benchmark")
+    parser.add_argument("--writes", type=int, default=200, help="add_expense calls for the write benchmark")
+    parser.add_argument("--data-dir", default="bench_data", help="where generated databases are kept")
+    parser.add_argument("--regenerate", action="store_true", help="rebuild datasets even if cached")
+    parser.add_argument("--generate-only", action="store_true", help="only build the datasets")
+    parser.add_argument("--no-views", action="store_true", help="skip the AppTest view runs")
+    parser.add_argument("--duckdb", action="store_true",
+                        help="also time the analytics reads on DuckDB over a Parquet snapshot")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", help="baseline JSON from an earlier run")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="median ratio above which --compare reports a regression (default: %(default)s)")
+    args = parser.parse_args()
+
+    results = []
+    for label in args.sizes.split(","):
+        rows, users = parse_size(label)
+        users = args.users or users
+        path = dataset(args.data_dir, label, rows, users, args.seed, args.regenerate)
+        if args.generate_only:
+            continue
+        db.DB_PATH = path
+        db.configure(path)
+        query_cache.invalidate()  # keys carry user and version, not the database
+        bench = bench_functions(args.repeat, args.writes)
+        if args.duckdb:
+            bench += bench_duckdb(path[:-3] + "-parquet", args.repeat)
+        if not args.no_views:
+            heavy = db.query("SELECT user_id FROM expenses GROUP BY user_id ORDER BY COUNT(*) DESC LIMIT 1")[0][0]
+            bench += bench_views(heavy, db.query_one("SELECT username FROM users WHERE id=?", (heavy,))[0],
+                                 args.repeat)
+        for r in bench:
+            r.update(dataset=label, dataset_rows=rows, dataset_users=users)
+            print(f"{label:>6} {r['bench']:<34} {r.get('user') or '':<7} median {r['median'] * 1000:9.2f}ms"
+                  + (f"  {r['ops_per_sec']:,.0f} ops/s" if "ops_per_sec" in r else ""))
+        results += bench
+    if args.generate_only:
+        return
+
+    report = {"meta": metadata(), "results": results}
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=1)
+        print(f"wrote {args.json}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print(f"{len(regressions)} benchmark(s) slower than {args.threshold}x the baseline.")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
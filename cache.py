@@ -0,0 +1,112 @@
+import functools
+import sys
+import threading
+from collections import OrderedDict
+
+import db
+
+# Process-wide query cache shared by every Streamlit session. Entries are keyed by
+# (user_id, data version, function, args): a write to a user's rows bumps their
+# version (see data_versions in db_init.py), so stale entries are never served and
+# one user's key can never match another's.
+
+MAX_ENTRIES = 512
+MAX_BYTES = 128 * 1024 * 1024
+
+
+def _sizeof(value, depth=0):
+    if hasattr(value, "memory_usage"):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    size = sys.getsizeof(value)
+    if depth < 10:
+        if isinstance(value, dict):
+            size += sum(_sizeof(k, depth + 1) + _sizeof(v, depth + 1) for k, v in value.items())
+        elif isinstance(value, (list, tuple)):
+            size += sum(_sizeof(v, depth + 1) for v in value)
+    return size
+
+
+def _copy(value):
+    # Hand out shallow DataFrame copies so a caller adding a column can't
+    # change what the next session gets back.
+    return value.copy(deep=False) if hasattr(value, "memory_usage") else value
+
+
+class QueryCache:
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._versions = {}  # user_id -> newest version seen
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def _drop(self, key):
+        _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return _copy(entry[0])
+
+    def put(self, key, value):
+        user_id, version = key[0], key[1]
+        size = _sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if version > self._versions.get(user_id, -1):
+                # The user wrote since these were cached; they can never hit again.
+                self._versions[user_id] = version
+                for stale in [k for k in self._entries if k[0] == user_id and k[1] < version]:
+                    self._drop(stale)
+            elif version < self._versions[user_id]:
+                return
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, user_id=None):
+        with self._lock:
+            for key in [k for k in self._entries if user_id is None or k[0] == user_id]:
+                self._drop(key)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+query_cache = QueryCache()
+
+
+def cached(fn, cache=query_cache):
+    """Wrap a fn(user_id, ...) read so repeat calls reuse the result until the user's next write."""
+    @functools.wraps(fn)
+    def wrapper(user_id, *args, **kwargs):
+        key = (user_id, db.data_version(user_id), fn.__name__, args, tuple(sorted(kwargs.items())))
+        value = cache.get(key)
+        if value is None:
+            value = fn(user_id, *args, **kwargs)
+            cache.put(key, value)
+            value = _copy(value)
+        return value
+    return wrapper
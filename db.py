@@ -0,0 +1,661 @@
+import hashlib
+import os
+import queue
+import random
+import sqlite3
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+import fts
+import instrument
+
+# Data-access layer: one bounded pool of tuned SQLite connections shared by
+# every Streamlit session (and the CLI scripts) instead of a fresh connect per call.
+
+DB_PATH = os.getenv("TRACKER_DB", "tracker.db")
+POOL_SIZE = int(os.getenv("TRACKER_DB_POOL_SIZE", "8"))
+STATEMENT_CACHE_SIZE = 256
+BUSY_RETRIES = 8
+BUSY_BACKOFF = 0.02  # seconds, doubled on every retry
+BUSY_BACKOFF_MAX = 1.0
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=2000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA temp_store=MEMORY",
+)
+
+
+def is_busy(exc):
+    msg = str(exc).lower()
+    return isinstance(exc, sqlite3.OperationalError) and ("locked" in msg or "busy" in msg)
+
+
+def retry_busy(fn, *args, retries=BUSY_RETRIES, **kwargs):
+    """Call fn, retrying with jittered exponential backoff while SQLite reports SQLITE_BUSY."""
+    delay = BUSY_BACKOFF
+    for attempt in range(retries + 1):
+        try:
+            return fn(*args, **kwargs)
+        except sqlite3.OperationalError as e:
+            if not is_busy(e) or attempt == retries:
+                raise
+            time.sleep(delay * (0.5 + random.random()))
+            delay = min(delay * 2, BUSY_BACKOFF_MAX)
+
+
+class ConnectionPool:
+    def __init__(self, path=DB_PATH, size=POOL_SIZE, timeout=30.0):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._created = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    @instrument.timed("db.connect")
+    def _connect(self):
+        # Autocommit mode: reads never hold a transaction open, writes go through
+        # transaction() which takes the write lock up front with BEGIN IMMEDIATE.
+        conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False,
+                               isolation_level=None, cached_statements=STATEMENT_CACHE_SIZE)
+        for pragma in PRAGMAS:
+            retry_busy(conn.execute, pragma)
+        return conn
+
+    def acquire(self):
+        if self._closed:
+            raise RuntimeError("Connection pool is closed.")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self._created -= 1
+                    raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise RuntimeError(f"Timed out waiting for a database connection ({self.size} in use).")
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        if self._closed:
+            conn.close()
+            return
+        self._idle.put_nowait(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    @contextmanager
+    def transaction(self):
+        with self.connection() as conn:
+            retry_busy(conn.execute, "BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            retry_busy(conn.commit)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def configure(path=DB_PATH, size=POOL_SIZE):
+    """Replace the process-wide pool; returns the new pool."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+        _pool = ConnectionPool(path, size)
+        return _pool
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+
+def connection():
+    return get_pool().connection()
+
+
+def transaction():
+    return get_pool().transaction()
+
+
+@instrument.timed("db.query", rows=len)
+def query(sql, params=()):
+    with connection() as conn:
+        return conn.execute(sql, params).fetchall()
+
+
+@instrument.timed("db.query_one", rows=lambda row: int(row is not None))
+def query_one(sql, params=()):
+    with connection() as conn:
+        return conn.execute(sql, params).fetchone()
+
+
+@instrument.timed("db.read_frame", rows=len)
+def read_frame(sql, params=()):
+    import pandas as pd
+    with connection() as conn:
+        return pd.read_sql_query(sql, conn, params=params)
+
+
+@instrument.timed("db.execute")
+def execute(sql, params=()):
+    with transaction() as conn:
+        return conn.execute(sql, params).lastrowid
+
+
+# --------- Users ----------
+def get_user(username):
+    return query_one("SELECT * FROM users WHERE username=?", (username,))
+
+
+def create_user(username, email, password_hash):
+    return execute("INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)",
+                   (username, email, password_hash))
+
+
+def update_password_hash(user_id, password_hash, old_hash):
+    # Only replaces the hash it was computed against, so a concurrent password change wins.
+    return execute("UPDATE users SET password_hash=? WHERE id=? AND password_hash=?",
+                   (password_hash, user_id, old_hash))
+
+
+# --------- Expenses & Income ----------
+EXPENSE_CATEGORIES = ["Food", "Shopping", "Transport", "Others"]
+
+
+def data_version(user_id):
+    """Counter bumped (by triggers) on every write to the user's expenses or income."""
+    row = query_one("SELECT version FROM data_versions WHERE user_id=?", (user_id,))
+    return row[0] if row else 0
+
+
+def add_expense(user_id, amount, category, note, date):
+    return execute("INSERT INTO expenses (user_id, amount, category, note, date) VALUES (?, ?, ?, ?, ?)",
+                   (user_id, amount, category, note, date))
+
+
+def add_income(user_id, amount, source, note, date):
+    return execute("INSERT INTO income (user_id, amount, source, note, date) VALUES (?, ?, ?, ?, ?)",
+                   (user_id, amount, source, note, date))
+
+
+def get_expenses(user_id):
+    return load_history(user_id, "expenses")
+
+
+def get_income(user_id):
+    return load_history(user_id, "income")
+
+
+def delete_expense(expense_id):
+    execute("DELETE FROM expenses WHERE id=?", (expense_id,))
+
+
+def delete_income(income_id):
+    execute("DELETE FROM income WHERE id=?", (income_id,))
+
+
+def update_expense(expense_id, amount, category, note, date):
+    execute("UPDATE expenses SET amount=?, category=?, note=?, date=? WHERE id=?",
+            (amount, category, note, date, expense_id))
+
+
+def update_income(income_id, amount, source, note, date):
+    execute("UPDATE income SET amount=?, source=?, note=?, date=? WHERE id=?",
+            (amount, source, note, date, income_id))
+
+
+# --------- Batched edits ----------
+# The history views queue edits and deletes and apply them here in one
+# transaction. Each batch first copies the rows it touches into undo_log, so
+# undo_batch() can put them back with two set-based statements.
+UNDO_KEEP = 20  # batches kept per user
+
+
+def apply_mutations(user_id, table, updates=None, deletes=()):
+    """Apply {id: (amount, category|source, note, date)} updates and deletes; returns the undo batch id."""
+    column = GROUP_COLUMNS[table]
+    # Ids may arrive as strings when the queue came through the backend's JSON API.
+    updates = {int(row_id): values for row_id, values in (updates or {}).items()}
+    deletes = [int(row_id) for row_id in deletes]
+    with transaction() as conn:
+        batch = conn.execute("INSERT INTO undo_batches (user_id, tbl, size) VALUES (?, ?, ?)",
+                             (user_id, table, len(updates) + len(deletes))).lastrowid
+        conn.executemany(f"INSERT INTO undo_log (batch_id, row_id, op, amount, grp, note, date) "
+                         f"SELECT ?, id, ?, amount, {column}, note, date FROM {table} WHERE id=? AND user_id=?",
+                         [(batch, "update", row_id, user_id) for row_id in updates]
+                         + [(batch, "delete", row_id, user_id) for row_id in deletes])
+        conn.executemany(f"UPDATE {table} SET amount=?, {column}=?, note=?, date=? WHERE id=? AND user_id=?",
+                         [(*values, row_id, user_id) for row_id, values in updates.items()])
+        conn.executemany(f"DELETE FROM {table} WHERE id=? AND user_id=?", [(row_id, user_id) for row_id in deletes])
+        conn.execute("DELETE FROM undo_batches WHERE user_id=? AND id NOT IN "
+                     "(SELECT id FROM undo_batches WHERE user_id=? ORDER BY id DESC LIMIT ?)",
+                     (user_id, user_id, UNDO_KEEP))
+        conn.execute("DELETE FROM undo_log WHERE batch_id NOT IN (SELECT id FROM undo_batches)")
+    return batch
+
+
+def last_batch(user_id, table):
+    """(batch id, rows, created_at) of the user's newest undoable batch on table, or None."""
+    return query_one("SELECT id, size, created_at FROM undo_batches WHERE user_id=? AND tbl=? "
+                     "ORDER BY id DESC LIMIT 1", (user_id, table))
+
+
+def undo_batch(user_id, batch_id):
+    """Restore the rows a batch changed or deleted; returns how many rows were restored."""
+    with transaction() as conn:
+        row = conn.execute("SELECT tbl FROM undo_batches WHERE id=? AND user_id=?", (batch_id, user_id)).fetchone()
+        if row is None:
+            return 0
+        table, column = row[0], GROUP_COLUMNS[row[0]]
+        restored = conn.execute(
+            f"UPDATE {table} SET (amount, {column}, note, date) = "
+            f"(SELECT amount, grp, note, date FROM undo_log WHERE batch_id=? AND row_id={table}.id) "
+            f"WHERE user_id=? AND id IN (SELECT row_id FROM undo_log WHERE batch_id=? AND op='update')",
+            (batch_id, user_id, batch_id)).rowcount
+        restored += conn.execute(
+            f"INSERT OR IGNORE INTO {table} (id, user_id, amount, {column}, note, date) "
+            f"SELECT row_id, ?, amount, grp, note, date FROM undo_log WHERE batch_id=? AND op='delete'",
+            (user_id, batch_id)).rowcount
+        conn.execute("DELETE FROM undo_log WHERE batch_id=?", (batch_id,))
+        conn.execute("DELETE FROM undo_batches WHERE id=?", (batch_id,))
+    return restored
+
+
+# --------- Bulk import ----------
+# importer.py parses and normalizes statements; each batch lands here so it is
+# one write (and one backend request) however many rows it holds.
+def fingerprint(date, amount, group, note):
+    key = f"{date}|{round((amount or 0) * 100)}|{(group or '').strip().lower()}|{(note or '').strip().lower()}"
+    return hashlib.blake2b(key.encode(), digest_size=8).digest()
+
+
+def import_watermark():
+    """{table: highest id} before an import starts; import_batch only dedupes against rows up to it."""
+    with connection() as conn:
+        return {table: conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+                for table in GROUP_COLUMNS}
+
+
+def _import_existing(conn, user_id, table, rows, upto=None):
+    # Fetch only rows sharing a (date, amount) with the batch: one seek each on the
+    # (user_id, date, amount) index, however much history the user already has.
+    column = GROUP_COLUMNS[table]
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS import_keys "
+                 "(date TEXT, amount REAL, PRIMARY KEY (date, amount)) WITHOUT ROWID")
+    conn.execute("DELETE FROM import_keys")
+    conn.executemany("INSERT OR IGNORE INTO import_keys VALUES (?, ?)", [row[:2] for row in rows])
+    # CROSS JOIN pins import_keys as the outer loop.
+    sql = (f"SELECT t.date, t.amount, t.{column}, t.note FROM import_keys k CROSS JOIN {table} t "
+           f"WHERE t.user_id=? AND t.date=k.date AND t.amount=k.amount")
+    params = [user_id]
+    if upto is not None:
+        sql += " AND t.id <= ?"
+        params.append(upto)
+    matches = conn.execute(sql, params)
+    return Counter(fingerprint(*row) for row in matches)
+
+
+def import_batch(user_id, batch, watermark=None):
+    """Insert {table: [(date, amount, group, note)]} in one transaction, skipping rows already present.
+
+    With watermark (from import_watermark), rows an earlier batch of the same
+    import inserted don't count as present. Returns (inserted, duplicates).
+    """
+    inserted = duplicates = 0
+    with transaction() as conn:
+        for table, rows in batch.items():
+            if not rows:
+                continue
+            # Multiset semantics: a file with two identical coffees inserts both,
+            # wherever the batches split, and re-importing it later inserts neither.
+            seen = _import_existing(conn, user_id, table, rows, watermark[table] if watermark else None)
+            fresh = []
+            for row in rows:
+                key = fingerprint(*row)
+                if seen[key]:
+                    seen[key] -= 1
+                    duplicates += 1
+                else:
+                    fresh.append((user_id, *row))
+            column = GROUP_COLUMNS[table]
+            conn.executemany(f"INSERT INTO {table} (user_id, date, amount, {column}, note) "
+                             f"VALUES (?, ?, ?, ?, ?)", fresh)
+            inserted += len(fresh)
+    return inserted, duplicates
+
+
+# --------- Advisor responses ----------
+def save_llm_response(user_id, prompt_key, model, version, answer, created_at, ttl):
+    with transaction() as conn:
+        conn.execute("INSERT OR REPLACE INTO llm_responses "
+                     "(user_id, prompt_key, model, version, answer, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                     (user_id, prompt_key, model, version, answer, created_at))
+        # Answers for older data versions or past their TTL can never be served again.
+        conn.execute("DELETE FROM llm_responses WHERE user_id=? AND (version < ? OR created_at < ?)",
+                     (user_id, version, created_at - ttl))
+
+
+# --------- Aggregates ----------
+# Totals and rollups computed by SQLite so only the small grouped result crosses
+# into Python. Whole-history reads come from the trigger-maintained summary tables
+# (see summaries.py); date-ranged reads ride the (user_id, date, amount) indexes.
+GROUP_COLUMNS = {"expenses": "category", "income": "source"}
+SUMMARY_TABLES = {"expenses": "expense_monthly", "income": "income_monthly"}
+
+
+def _user_filter(user_id, date_from=None, date_to=None):
+    where, params = "user_id=?", [user_id]
+    if date_from is not None:
+        where += " AND date >= ?"
+        params.append(str(date_from))
+    if date_to is not None:
+        where += " AND date <= ?"
+        params.append(str(date_to))
+    return where, params
+
+
+def get_totals(user_id, date_from=None, date_to=None):
+    """Return (total_income, total_expense) for a user."""
+    if date_from is None and date_to is None:
+        row = query_one("SELECT income, expense FROM user_totals WHERE user_id=?", (user_id,))
+        return (row[0], row[1]) if row else (0, 0)
+    where, params = _user_filter(user_id, date_from, date_to)
+    row = query_one(f"SELECT (SELECT COALESCE(SUM(amount), 0) FROM income WHERE {where}), "
+                    f"(SELECT COALESCE(SUM(amount), 0) FROM expenses WHERE {where})", params * 2)
+    return row[0], row[1]
+
+
+def get_group_totals(user_id, table="expenses", date_from=None, date_to=None):
+    """Per-category (expenses) or per-source (income) sums as a small DataFrame."""
+    column = GROUP_COLUMNS[table]
+    if date_from is None and date_to is None:
+        return read_frame(f"SELECT {column}, SUM(amount) AS amount FROM {SUMMARY_TABLES[table]} "
+                          f"WHERE user_id=? GROUP BY {column}", (user_id,))
+    where, params = _user_filter(user_id, date_from, date_to)
+    return read_frame(f"SELECT {column}, SUM(amount) AS amount FROM {table} "
+                      f"WHERE {where} GROUP BY {column}", params)
+
+
+def get_monthly_totals(user_id, table="expenses", date_from=None, date_to=None):
+    """Per-month ('YYYY-MM') sums as a small DataFrame ordered by month."""
+    if table not in GROUP_COLUMNS:
+        raise ValueError(f"Unknown table: {table}")
+    if date_from is None and date_to is None:
+        months = query(f"SELECT month, SUM(amount) FROM {SUMMARY_TABLES[table]} "
+                       f"WHERE user_id=? GROUP BY month ORDER BY month", (user_id,))
+        if not any(month == "" for month, _ in months):
+            import pandas as pd
+            return pd.DataFrame(months, columns=["month", "amount"])
+    where, params = _user_filter(user_id, date_from, date_to)
+    df = read_frame(f"SELECT strftime('%Y-%m', date) AS month, SUM(amount) AS amount FROM {table} "
+                    f"WHERE {where} GROUP BY month ORDER BY month", params)
+    if df["month"].isna().any():
+        # Legacy rows whose date SQLite can't parse: bucket only those in pandas.
+        import pandas as pd
+        odd = read_frame(f"SELECT date, amount FROM {table} "
+                         f"WHERE {where} AND strftime('%Y-%m', date) IS NULL", params)
+        odd["month"] = pd.to_datetime(odd["date"], errors="coerce").dt.to_period("M").astype(str)
+        odd = odd[odd["month"] != "NaT"]
+        df = (pd.concat([df.dropna(subset=["month"]), odd[["month", "amount"]]])
+              .groupby("month", as_index=False)["amount"].sum())
+    return df
+
+
+def get_top_groups(user_id, table="expenses", limit=3):
+    """[(category|source, amount)] with the largest whole-history sums, from the summaries."""
+    column = GROUP_COLUMNS[table]
+    return query(f"SELECT {column}, SUM(amount) FROM {SUMMARY_TABLES[table]} WHERE user_id=? "
+                 f"GROUP BY {column} ORDER BY 2 DESC LIMIT ?", (user_id, limit))
+
+
+def get_recent_months(user_id, months=3):
+    """[(month, income, expense)] for the user's latest months with any activity, oldest first."""
+    rows = query('''
+        SELECT month, SUM(income), SUM(expense) FROM (
+            SELECT month, amount AS income, 0 AS expense FROM income_monthly WHERE user_id=? AND month <> ''
+            UNION ALL
+            SELECT month, 0, amount FROM expense_monthly WHERE user_id=? AND month <> ''
+        ) GROUP BY month ORDER BY month DESC LIMIT ?
+    ''', (user_id, user_id, months))
+    return rows[::-1]
+
+
+def get_year_over_year(user_id, table="expenses", date_from=None, date_to=None):
+    """Sums per (year, month number), for comparing the same month across years; whole history from the summaries."""
+    import pandas as pd
+    if date_from is None and date_to is None:
+        rows = query(f"SELECT substr(month, 1, 4), CAST(substr(month, 6, 2) AS INTEGER), SUM(amount) "
+                     f"FROM {SUMMARY_TABLES[table]} WHERE user_id=? AND month <> '' GROUP BY 1, 2 ORDER BY 1, 2",
+                     (user_id,))
+    else:
+        if table not in GROUP_COLUMNS:
+            raise ValueError(f"Unknown table: {table}")
+        where, params = _user_filter(user_id, date_from, date_to)
+        rows = query(f"SELECT strftime('%Y', date), CAST(strftime('%m', date) AS INTEGER), SUM(amount) "
+                     f"FROM {table} WHERE {where} AND date(date) IS NOT NULL GROUP BY 1, 2 ORDER BY 1, 2", params)
+    return pd.DataFrame(rows, columns=["year", "month", "amount"])
+
+
+# --------- History (paginated) ----------
+# Keyset pagination over (date, id): each page starts after the last (date, id)
+# of the previous one, so deep pages cost the same as the first and the date
+# range and search filters are applied by SQLite rather than pandas. Search goes
+# through the FTS5 index, scoped to the user's rows, when it exists and falls
+# back to a LIKE substring scan.
+_fts_installed = {}
+
+
+def has_fts():
+    path = get_pool().path
+    if not _fts_installed.get(path):
+        with connection() as conn:
+            _fts_installed[path] = fts.installed(conn)
+    return _fts_installed[path]
+
+
+def _history_filter(user_id, table, date_from=None, date_to=None, search=""):
+    if table not in GROUP_COLUMNS:
+        raise ValueError(f"Unknown table: {table}")
+    where, params = _user_filter(user_id, date_from, date_to)
+    if search and search.strip():
+        match = fts.match_query(search, user_id) if has_fts() else ""
+        if match:
+            fts_table = fts.FTS_TABLES[table][0]
+            where += f" AND id IN (SELECT rowid FROM {fts_table} WHERE {fts_table} MATCH ?)"
+            params.append(match)
+        else:
+            pattern = "%" + search.strip().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            where += f" AND (note LIKE ? ESCAPE '\\' OR {GROUP_COLUMNS[table]} LIKE ? ESCAPE '\\')"
+            params += [pattern, pattern]
+    return where, params
+
+
+def search_history(user_id, table="expenses", search="", date_from=None, date_to=None, limit=25, offset=0):
+    """Rows matching search, best match (FTS5 bm25) first; newest first under the LIKE fallback."""
+    match = fts.match_query(search, user_id) if has_fts() else ""
+    if not match:
+        where, params = _history_filter(user_id, table, date_from, date_to, search)
+        return read_frame(f"SELECT * FROM {table} WHERE {where} "
+                          f"ORDER BY date DESC, id DESC LIMIT ? OFFSET ?", params + [limit, offset])
+    fts_table = fts.FTS_TABLES[table][0]
+    where, params = _user_filter(user_id, date_from, date_to)
+    return read_frame(f"SELECT {table}.* FROM {fts_table} JOIN {table} ON {table}.id = {fts_table}.rowid "
+                      f"WHERE {fts_table} MATCH ? AND {where} "
+                      f"ORDER BY {fts_table}.rank, {table}.id LIMIT ? OFFSET ?",
+                      [match] + params + [limit, offset])
+
+
+def get_date_bounds(user_id, table="expenses"):
+    """(earliest, latest) date of the user's rows, or (None, None) when there are none."""
+    if table not in GROUP_COLUMNS:
+        raise ValueError(f"Unknown table: {table}")
+    return query_one(f"SELECT MIN(date), MAX(date) FROM {table} WHERE user_id=?", (user_id,))
+
+
+def count_history(user_id, table="expenses", date_from=None, date_to=None, search=""):
+    where, params = _history_filter(user_id, table, date_from, date_to, search)
+    return query_one(f"SELECT COUNT(*) FROM {table} WHERE {where}", params)[0]
+
+
+def get_history_page(user_id, table="expenses", date_from=None, date_to=None, search="",
+                     after=None, limit=25, descending=True):
+    """One page of rows ordered by (date, id); pass the last row's (date, id) as after for the next."""
+    where, params = _history_filter(user_id, table, date_from, date_to, search)
+    if after is not None:
+        where += " AND (date, id) < (?, ?)" if descending else " AND (date, id) > (?, ?)"
+        params += list(after)
+    order = "DESC" if descending else "ASC"
+    return read_frame(f"SELECT * FROM {table} WHERE {where} "
+                      f"ORDER BY date {order}, id {order} LIMIT ?", params + [limit])
+
+
+# --------- Streaming reads ----------
+def iter_rows(sql, params=(), chunk_size=5000):
+    """Yield the column names, then lists of up to chunk_size rows, straight off the cursor."""
+    with connection() as conn:
+        cursor = conn.execute(sql, params)
+        yield [d[0] for d in cursor.description]
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+
+
+def iter_history(user_id, table="expenses", date_from=None, date_to=None, search="", chunk_size=5000):
+    where, params = _history_filter(user_id, table, date_from, date_to, search)
+    return iter_rows(f"SELECT * FROM {table} WHERE {where} ORDER BY date DESC, id DESC", params, chunk_size)
+
+
+def iter_account(user_id, chunk_size=5000):
+    """Every expense and income row of a user in one stream, oldest first, tagged by type."""
+    return iter_rows('''
+        SELECT 'expense' AS type, id, date, amount, category AS label, note FROM expenses WHERE user_id=?
+        UNION ALL
+        SELECT 'income' AS type, id, date, amount, source AS label, note FROM income WHERE user_id=?
+        ORDER BY date, type, id
+    ''', (user_id, user_id), chunk_size)
+
+
+# --------- Typed history frames ----------
+# Whole-history loads for vectorized work in pandas or Arrow. Rows go straight
+# into compact columns instead of object strings: datetime64 dates, an int32
+# YYYYMM month key, dictionary-encoded category/source and int64 paise amounts
+# (exact sums, no float drift). SQLite does the date and amount conversion.
+NAT = -2 ** 63  # datetime64 NaT, for dates SQLite can't parse
+
+
+def _group_lookup(table):
+    # Known categories first, so their codes are the same for every user.
+    return {name: i for i, name in enumerate(EXPENSE_CATEGORIES)} if table == "expenses" else {}
+
+
+def _typed_chunks(user_id, table, lookup, date_from=None, date_to=None, chunk_size=50000):
+    """Yield (ids, dates, months, group codes, paise, notes) per chunk; lookup maps group names to codes."""
+    import numpy as np
+    column = GROUP_COLUMNS[table]
+    where, params = _user_filter(user_id, date_from, date_to)
+    rows = iter_rows(f"SELECT id, COALESCE(CAST(julianday(date) - 2440587.5 AS INTEGER), {NAT}), "
+                     f"COALESCE(CAST(strftime('%Y%m', date) AS INTEGER), 0), {column}, "
+                     f"CAST(ROUND(COALESCE(amount, 0) * 100) AS INTEGER), note "
+                     f"FROM {table} WHERE {where} ORDER BY date", params, chunk_size)
+    next(rows)
+    for chunk in rows:
+        ids, days, months, groups, paise, notes = zip(*chunk)
+        codes = np.fromiter((-1 if g is None else lookup.setdefault(g, len(lookup)) for g in groups),
+                            np.int32, len(groups))
+        yield (np.array(ids, np.int64), np.array(days, np.int64).view("datetime64[D]"),
+               np.array(months, np.int32), codes, np.array(paise, np.int64), notes)
+
+
+def load_history(user_id, table="expenses", date_from=None, date_to=None, chunk_size=50000):
+    """All of a user's rows as a compact DataFrame: id, date, month, category|source, paise, note."""
+    import numpy as np
+    import pandas as pd
+    column = GROUP_COLUMNS[table]
+    parts, lookup = [], _group_lookup(table)
+    for arrays in _typed_chunks(user_id, table, lookup, date_from, date_to, chunk_size):
+        parts.append(arrays[:5] + (pd.array(arrays[5], dtype="string"),))
+    if parts:
+        ids, dates, months, codes, paise = (np.concatenate([p[i] for p in parts]) for i in range(5))
+        notes = pd.concat([pd.Series(p[5]) for p in parts], ignore_index=True)
+    else:
+        ids, months, codes, paise = (np.empty(0, t) for t in (np.int64, np.int32, np.int32, np.int64))
+        dates, notes = np.empty(0, "datetime64[D]"), pd.Series(pd.array([], dtype="string"))
+    return pd.DataFrame({
+        "id": ids,
+        "date": dates,
+        "month": months,
+        column: pd.Categorical.from_codes(codes, categories=list(lookup)),
+        "paise": paise,
+        "note": notes,
+    })
+
+
+def iter_history_batches(user_id, table="expenses", date_from=None, date_to=None, chunk_size=50000):
+    """Yield the same columns as load_history as pyarrow RecordBatches, one per chunk."""
+    import pyarrow as pa
+    column = GROUP_COLUMNS[table]
+    lookup = _group_lookup(table)
+    for ids, dates, months, codes, paise, notes in _typed_chunks(user_id, table, lookup, date_from, date_to,
+                                                                 chunk_size):
+        yield pa.RecordBatch.from_arrays([
+            pa.array(ids),
+            pa.array(dates, from_pandas=True),
+            pa.array(months),
+            pa.DictionaryArray.from_arrays(pa.array(codes, mask=codes < 0), pa.array(list(lookup), pa.string())),
+            pa.array(paise),
+            pa.array(notes, pa.string()),
+        ], names=["id", "date", "month", column, "paise", "note"])
+
+
+def load_history_arrow(user_id, table="expenses", date_from=None, date_to=None, chunk_size=50000):
+    """load_history as a chunked pyarrow Table, for histories too large to hold as one DataFrame."""
+    import pyarrow as pa
+    batches = list(iter_history_batches(user_id, table, date_from, date_to, chunk_size))
+    if not batches:
+        column = GROUP_COLUMNS[table]
+        return pa.table({"id": pa.array([], pa.int64()), "date": pa.array([], pa.date32()),
+                         "month": pa.array([], pa.int32()),
+                         column: pa.array([], pa.dictionary(pa.int32(), pa.string())),
+                         "paise": pa.array([], pa.int64()), "note": pa.array([], pa.string())})
+    return pa.Table.from_batches(batches)
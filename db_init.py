@@ -1,42 +1,245 @@
+import argparse
 import sqlite3
 
-conn = sqlite3.connect('tracker.db')
-c = conn.cursor()
-
-c.execute('''
-CREATE TABLE IF NOT EXISTS users (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    username TEXT UNIQUE NOT NULL,
-    password_hash TEXT NOT NULL,
-    email TEXT UNIQUE NOT NULL,
-    created_at TEXT DEFAULT CURRENT_TIMESTAMP
-)
-''')
-
-c.execute('''
-CREATE TABLE IF NOT EXISTS expenses (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id INTEGER,
-    amount REAL,
-    category TEXT,
-    note TEXT,
-    date TEXT,
-    FOREIGN KEY (user_id) REFERENCES users(id)
-)
-''')
-
-c.execute('''
-CREATE TABLE IF NOT EXISTS income (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id INTEGER,
-    amount REAL,
-    source TEXT,
-    note TEXT,
-    date TEXT,
-    FOREIGN KEY (user_id) REFERENCES users(id)
-)
-''')
-
-conn.commit()
-conn.close()
-print("Database initialized successfully!")
+import fts
+import summaries
+from db import DB_PATH
+
+# Versioned schema migrations. Each entry is (version, name, steps); a step is
+# either an SQL statement or a callable taking the connection. Applied versions
+# are recorded in schema_version, so running this again upgrades a database in place.
+
+def _normalize_dates(conn):
+    # Dates used to be free-form TEXT; store them as ISO-8601 (YYYY-MM-DD) so they
+    # sort, range-filter and index correctly. Unparseable values are left untouched.
+    for table in ("expenses", "income"):
+        conn.execute(f"UPDATE {table} SET date = date(date) "
+                     f"WHERE date(date) IS NOT NULL AND date <> date(date)")
+
+
+def _iso_date_guards(table):
+    return [
+        f'''CREATE TRIGGER IF NOT EXISTS {table}_iso_date_insert BEFORE INSERT ON {table}
+            WHEN NEW.date IS NOT NULL AND NEW.date IS NOT date(NEW.date)
+            BEGIN SELECT RAISE(ABORT, 'date must be ISO-8601 (YYYY-MM-DD)'); END''',
+        f'''CREATE TRIGGER IF NOT EXISTS {table}_iso_date_update BEFORE UPDATE OF date ON {table}
+            WHEN NEW.date IS NOT NULL AND NEW.date IS NOT date(NEW.date)
+            BEGIN SELECT RAISE(ABORT, 'date must be ISO-8601 (YYYY-MM-DD)'); END''',
+    ]
+
+
+def _version_bumps(table):
+    # Every write to a user's rows bumps their version; caches key on it.
+    bump = ("INSERT INTO data_versions (user_id, version) VALUES ({row}.user_id, 1) "
+            "ON CONFLICT (user_id) DO UPDATE SET version = version + 1;")
+    return [
+        f'''CREATE TRIGGER IF NOT EXISTS {table}_version_insert AFTER INSERT ON {table}
+            BEGIN {bump.format(row="NEW")} END''',
+        f'''CREATE TRIGGER IF NOT EXISTS {table}_version_delete AFTER DELETE ON {table}
+            BEGIN {bump.format(row="OLD")} END''',
+        f'''CREATE TRIGGER IF NOT EXISTS {table}_version_update AFTER UPDATE ON {table}
+            BEGIN {bump.format(row="OLD")} {bump.format(row="NEW")} END''',
+    ]
+
+
+MIGRATIONS = [
+    (1, "base tables", [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS expenses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            amount REAL,
+            category TEXT,
+            note TEXT,
+            date TEXT,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS income (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            amount REAL,
+            source TEXT,
+            note TEXT,
+            date TEXT,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+        ''',
+    ]),
+    (2, "iso dates and per-user indexes", [
+        _normalize_dates,
+        *_iso_date_guards("expenses"),
+        *_iso_date_guards("income"),
+        "CREATE INDEX IF NOT EXISTS idx_expenses_user_date ON expenses (user_id, date, amount)",
+        "CREATE INDEX IF NOT EXISTS idx_expenses_user_category ON expenses (user_id, category, amount)",
+        "CREATE INDEX IF NOT EXISTS idx_income_user_date ON income (user_id, date, amount)",
+        "CREATE INDEX IF NOT EXISTS idx_income_user_source ON income (user_id, source, amount)",
+    ]),
+    (3, "per-user summary tables", [
+        *summaries.TABLES,
+        *summaries.triggers("expenses"),
+        *summaries.triggers("income"),
+        summaries.rebuild,
+    ]),
+    (4, "per-user data versions", [
+        '''
+        CREATE TABLE IF NOT EXISTS data_versions (
+            user_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        *_version_bumps("expenses"),
+        *_version_bumps("income"),
+    ]),
+    (5, "full-text search", [fts.install]),
+    (6, "advisor response cache", [
+        '''
+        CREATE TABLE IF NOT EXISTS llm_responses (
+            user_id INTEGER NOT NULL,
+            prompt_key TEXT NOT NULL,
+            model TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            answer TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (user_id, prompt_key, model)
+        ) WITHOUT ROWID
+        ''',
+    ]),
+    (7, "undo log for batched edits", [
+        '''
+        CREATE TABLE IF NOT EXISTS undo_batches (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            tbl TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_undo_batches_user ON undo_batches (user_id, tbl, id)",
+        '''
+        CREATE TABLE IF NOT EXISTS undo_log (
+            batch_id INTEGER NOT NULL,
+            row_id INTEGER NOT NULL,
+            op TEXT NOT NULL,
+            amount REAL,
+            grp TEXT,
+            note TEXT,
+            date TEXT,
+            PRIMARY KEY (batch_id, row_id)
+        ) WITHOUT ROWID
+        ''',
+    ]),
+    (8, "per-user full-text index", [fts.reinstall]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def migrate(conn, target=LATEST_VERSION):
+    """Apply every pending migration up to target, each in its own transaction."""
+    applied = []
+    for version, name, steps in MIGRATIONS:
+        if version > target:
+            break
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Re-read under the write lock so concurrent starters don't double-apply.
+            if version <= current_version(conn):
+                conn.rollback()
+                continue
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute("INSERT INTO schema_version (version, name) VALUES (?, ?)", (version, name))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
+
+
+# Hot queries and the index each one must use; check_query_plans() is the
+# regression guard against a schema or query change silently falling back to a scan.
+HOT_QUERIES = [
+    ("SELECT * FROM expenses WHERE user_id=?", (1,), "idx_expenses_user_"),
+    ("SELECT * FROM income WHERE user_id=?", (1,), "idx_income_user_"),
+    ("SELECT * FROM expenses WHERE user_id=? AND date BETWEEN ? AND ?",
+     (1, "2024-01-01", "2024-12-31"), "idx_expenses_user_date"),
+    ("SELECT * FROM income WHERE user_id=? AND date BETWEEN ? AND ?",
+     (1, "2024-01-01", "2024-12-31"), "idx_income_user_date"),
+    ("SELECT category, SUM(amount) FROM expenses WHERE user_id=? GROUP BY category",
+     (1,), "COVERING INDEX idx_expenses_user_category"),
+    ("SELECT source, SUM(amount) FROM income WHERE user_id=? GROUP BY source",
+     (1,), "COVERING INDEX idx_income_user_source"),
+    ("SELECT strftime('%Y-%m', date), SUM(amount) FROM expenses WHERE user_id=? GROUP BY 1",
+     (1,), "COVERING INDEX idx_expenses_user_date"),
+    # History pages: keyset pagination and the date-range bounds.
+    ("SELECT * FROM expenses WHERE user_id=? AND (date, id) < (?, ?) ORDER BY date DESC, id DESC LIMIT ?",
+     (1, "2024-06-01", 1000, 25), "idx_expenses_user_date"),
+    ("SELECT * FROM income WHERE user_id=? AND (date, id) > (?, ?) ORDER BY date ASC, id ASC LIMIT ?",
+     (1, "2024-06-01", 1000, 25), "idx_income_user_date"),
+    ("SELECT MIN(date), MAX(date) FROM expenses WHERE user_id=?", (1,), "COVERING INDEX idx_expenses_user_date"),
+    ("SELECT MIN(date), MAX(date) FROM income WHERE user_id=?", (1,), "COVERING INDEX idx_income_user_date"),
+]
+
+
+def check_query_plans(conn, queries=HOT_QUERIES):
+    """Return (sql, plan) for every hot query whose plan doesn't use its expected index."""
+    failures = []
+    for sql, params, expected in queries:
+        plan = " | ".join(row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params))
+        if expected not in plan:
+            failures.append((sql, plan))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create or upgrade the tracker database.")
+    parser.add_argument("--db", default=DB_PATH, help="database file (default: %(default)s)")
+    parser.add_argument("--check", action="store_true",
+                        help="fail if a hot query does not use its index")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    applied = migrate(conn)
+    print(f"Schema at version {current_version(conn)} (applied: {applied or 'none'}).")
+    if args.check:
+        failures = check_query_plans(conn)
+        for sql, plan in failures:
+            print(f"NOT INDEXED: {sql}\n    plan: {plan}")
+        conn.close()
+        if failures:
+            raise SystemExit(1)
+        print("All hot queries use their indexes.")
+        return
+    conn.close()
+    print("Database initialized successfully!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import argparse
+import csv
+import gzip
+import io
+import os
+import tempfile
+
+import db
+import instrument
+
+# Streaming export of history or a whole account. Rows come off the SQLite cursor
+# in chunks and go straight into the output file, so memory use is set by
+# CHUNK_SIZE rather than by how much history the user has. Parquet and Arrow
+# output need pyarrow, imported only when one of those formats is asked for.
+
+CHUNK_SIZE = 5000
+
+FORMATS = {
+    # name: (file extension, mime type)
+    "csv": (".csv", "text/csv"),
+    "csv.gz": (".csv.gz", "application/gzip"),
+    "parquet": (".parquet", "application/vnd.apache.parquet"),
+    "arrow": (".arrow", "application/vnd.apache.arrow.file"),
+}
+
+
+def _chunks(user_id, scope, date_from=None, date_to=None, search="", chunk_size=CHUNK_SIZE):
+    if scope == "all":
+        return db.iter_account(user_id, chunk_size)
+    return db.iter_history(user_id, scope, date_from, date_to, search, chunk_size)
+
+
+def _write_csv(out, chunks):
+    text = io.TextIOWrapper(out, encoding="utf-8", newline="", write_through=True)
+    writer = csv.writer(text)
+    rows = 0
+    try:
+        writer.writerow(next(chunks))
+        for chunk in chunks:
+            writer.writerows(chunk)
+            rows += len(chunk)
+    finally:
+        # Hand out back to the caller open; closing the wrapper would close it.
+        text.flush()
+        text.detach()
+    return rows
+
+
+def _arrow_schema(pa, columns):
+    types = {"id": pa.int64(), "user_id": pa.int64(), "amount": pa.float64()}
+    return pa.schema([(name, types.get(name, pa.string())) for name in columns])
+
+
+def _write_arrow(out, chunks, fmt):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError(f"{fmt} export needs pyarrow (pip install pyarrow).")
+    schema = _arrow_schema(pa, next(chunks))
+    sink = pa.PythonFile(out, mode="w")
+    writer = pq.ParquetWriter(sink, schema) if fmt == "parquet" else pa.ipc.new_file(sink, schema)
+    rows = 0
+    try:
+        for chunk in chunks:
+            columns = list(zip(*chunk))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(col, type=field.type) for col, field in zip(columns, schema)], schema=schema))
+            rows += len(chunk)
+    finally:
+        writer.close()
+    return rows
+
+
+@instrument.timed("export", rows=lambda rows: rows)
+def export(out, user_id, scope="expenses", fmt="csv", date_from=None, date_to=None, search="",
+           chunk_size=CHUNK_SIZE):
+    """Write an export to the binary file object out; returns the number of data rows written.
+
+    scope is "expenses", "income" (honouring the history filters) or "all" for every
+    expense and income row of the account.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    if scope not in ("all", *db.GROUP_COLUMNS):
+        raise ValueError(f"Unknown export scope: {scope}")
+    chunks = _chunks(user_id, scope, date_from, date_to, search, chunk_size)
+    if fmt == "csv":
+        return _write_csv(out, chunks)
+    if fmt == "csv.gz":
+        with gzip.GzipFile(fileobj=out, mode="wb") as gz:
+            return _write_csv(gz, chunks)
+    return _write_arrow(out, chunks, fmt)
+
+
+def export_to_tempfile(user_id, scope="expenses", fmt="csv", date_from=None, date_to=None, search=""):
+    """Export into an anonymous temp file, rewound and ready for st.download_button."""
+    # download_button takes raw file objects, so write through a buffer and hand back the raw file.
+    raw = tempfile.TemporaryFile(buffering=0)
+    out = io.BufferedWriter(raw)
+    export(out, user_id, scope, fmt, date_from, date_to, search)
+    out.flush()
+    out.detach()
+    raw.seek(0)
+    return raw
+
+
+def file_name(scope, fmt):
+    return ("account" if scope == "all" else scope) + FORMATS[fmt][0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a user's expenses, income or whole account.")
+    parser.add_argument("--user", required=True, help="username to export")
+    parser.add_argument("--scope", choices=["all", "expenses", "income"], default="all")
+    parser.add_argument("--format", choices=list(FORMATS), default="csv")
+    parser.add_argument("--from", dest="date_from", help="earliest date (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="date_to", help="latest date (YYYY-MM-DD)")
+    parser.add_argument("-o", "--output", help="output file (default: <scope><ext>)")
+    parser.add_argument("--db", default=db.DB_PATH, help="database file (default: %(default)s)")
+    args = parser.parse_args()
+
+    db.configure(args.db)
+    user = db.get_user(args.user)
+    if not user:
+        raise SystemExit(f"User {args.user!r} does not exist.")
+    if args.scope == "all" and (args.date_from or args.date_to):
+        raise SystemExit("--from/--to only apply to --scope expenses or income.")
+    path = args.output or file_name(args.scope, args.format)
+    try:
+        with open(path, "wb") as out:
+            rows = export(out, user[0], args.scope, args.format, args.date_from, args.date_to)
+    except RuntimeError as e:
+        os.remove(path)
+        raise SystemExit(str(e))
+    print(f"Exported {rows:,} rows to {path}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import re
+import sqlite3
+
+# SQLite FTS5 index over expenses (note, category) and income (note, source),
+# kept in sync with the base tables by triggers. The index is external-content,
+# so it stores only the token index and reads text back from the base table
+# (through a view that adds the owner column). Builds of SQLite without FTS5
+# skip it; search then falls back to LIKE.
+#
+# Every row also carries its owner as a single "u<user_id>" token, and queries
+# AND it into the MATCH, so a search walks one user's postings rather than
+# every user's matches before filtering on user_id.
+
+FTS_TABLES = {
+    # base table: (fts table, group column)
+    "expenses": ("expenses_fts", "category"),
+    "income": ("income_fts", "source"),
+}
+
+
+def supported(conn):
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp._fts5_probe USING fts5(x)")
+    except sqlite3.OperationalError:
+        return False
+    conn.execute("DROP TABLE temp._fts5_probe")
+    return True
+
+
+def installed(conn):
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='expenses_fts'").fetchone()
+    return row is not None
+
+
+def _statements(table):
+    fts, column = FTS_TABLES[table]
+    insert = (f"INSERT INTO {fts} (rowid, note, {column}, owner) "
+              f"VALUES (NEW.id, NEW.note, NEW.{column}, 'u' || NEW.user_id);")
+    delete = (f"INSERT INTO {fts} ({fts}, rowid, note, {column}, owner) "
+              f"VALUES ('delete', OLD.id, OLD.note, OLD.{column}, 'u' || OLD.user_id);")
+    return [
+        f'''CREATE VIEW IF NOT EXISTS {fts}_content AS
+            SELECT id, note, {column}, 'u' || user_id AS owner FROM {table}''',
+        f'''CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+            note, {column}, owner, content='{fts}_content', content_rowid='id', tokenize='unicode61'
+        )''',
+        # The owner token is a filter, not a relevance signal.
+        f"INSERT INTO {fts} ({fts}, rank) VALUES ('rank', 'bm25(1.0, 1.0, 0.0)')",
+        f'''CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table}
+            BEGIN {insert} END''',
+        f'''CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table}
+            BEGIN {delete} END''',
+        f'''CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE OF note, {column}, user_id ON {table}
+            BEGIN {delete} {insert} END''',
+        f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')",
+    ]
+
+
+def install(conn):
+    """Migration step: create and populate the FTS tables, or do nothing without FTS5."""
+    if not supported(conn):
+        return
+    for table in FTS_TABLES:
+        for stmt in _statements(table):
+            conn.execute(stmt)
+
+
+def reinstall(conn):
+    """Migration step: replace an index built before the owner column with the current one."""
+    if not supported(conn):
+        return
+    for table, (fts, _) in FTS_TABLES.items():
+        for action in ("insert", "delete", "update"):
+            conn.execute(f"DROP TRIGGER IF EXISTS {table}_fts_{action}")
+        conn.execute(f"DROP TABLE IF EXISTS {fts}")
+        conn.execute(f"DROP VIEW IF EXISTS {fts}_content")
+    install(conn)
+
+
+def match_query(text, user_id=None):
+    """Turn free text into an FTS5 query: every word must prefix-match a note or group (of user_id's rows)."""
+    words = re.findall(r"\w+", text)
+    if not words:
+        return ""
+    query = "- owner : (%s)" % " ".join(f'"{w}"*' for w in words)
+    return f"owner:u{int(user_id)} AND {query}" if user_id is not None else query
@@ -0,0 +1,321 @@
+import argparse
+import csv
+import io
+import re
+import time
+from datetime import datetime
+
+import backend
+import db
+import instrument
+from db_init import migrate
+
+# Bulk import of bank statements (CSV or OFX/QFX). Files are read as a stream and
+# written in batches: each batch is normalized, deduplicated against rows already
+# in the database and inserted with one executemany in one transaction, so memory
+# stays bounded by the batch size whatever the file size.
+
+BATCH_SIZE = 5000
+MAX_ERRORS = 50
+MAX_HELD = 5000  # rows kept waiting for the file's date format to be settled
+
+DATE_FORMATS = ["%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%Y/%m/%d", "%Y%m%d",
+                "%d/%m/%y", "%d-%m-%y", "%d %b %Y", "%d-%b-%Y", "%d %b %y", "%d-%b-%y",
+                "%b %d, %Y", "%m/%d/%Y"]
+
+HEADER_ALIASES = {
+    "date": ["date", "txn date", "transaction date", "value date", "posted", "posting date", "dtposted"],
+    "amount": ["amount", "amt", "trnamt", "transaction amount"],
+    "debit": ["debit", "withdrawal", "withdrawal amt", "withdrawals", "dr", "debit amount"],
+    "credit": ["credit", "deposit", "deposit amt", "deposits", "cr", "credit amount"],
+    "category": ["category"],
+    "source": ["source"],
+    "note": ["note", "notes", "description", "narration", "memo", "details", "particulars",
+             "remarks", "name", "payee"],
+}
+
+# Keyword hints used when a statement has no category column.
+CATEGORY_HINTS = {
+    "Food": ["swiggy", "zomato", "restaurant", "cafe", "food", "dominos", "pizza", "grocer"],
+    "Transport": ["uber", "ola", "rapido", "metro", "fuel", "petrol", "irctc", "railway", "fastag"],
+    "Shopping": ["amazon", "flipkart", "myntra", "ajio", "mall", "store", "mart"],
+}
+
+
+class RowError(ValueError):
+    pass
+
+
+class AmbiguousDate(RowError):
+    pass
+
+
+class DateParser:
+    """Reads one file's dates. Statements use one format throughout, so the first
+    date only one format can read fixes the format for the rest of the file
+    (or date_format fixes it up front).
+
+    Until then a value that formats read as different dates (01/02/2024) raises
+    AmbiguousDate rather than being guessed.
+    """
+
+    def __init__(self, formats=DATE_FORMATS, date_format=None):
+        self.formats = formats
+        self.format = date_format
+
+    def __call__(self, value):
+        value = value.strip()
+        if self.format:
+            try:
+                return datetime.strptime(value, self.format).date().isoformat()
+            except ValueError:
+                raise RowError(f"date {value!r} does not match this file's format {format_label(self.format)}")
+        matches = {}
+        for fmt in self.formats:
+            try:
+                parsed = datetime.strptime(value, fmt).date()
+            except ValueError:
+                continue
+            if parsed.year >= 1900:  # %Y also reads "24" as the year 24
+                matches[fmt] = parsed.isoformat()
+        if not matches:
+            raise RowError(f"unrecognised date {value!r}")
+        if len(set(matches.values())) > 1:
+            raise AmbiguousDate(f"ambiguous date {value!r}: day/month order unknown, choose the date format")
+        if len(matches) == 1:
+            self.format = next(iter(matches))
+        return next(iter(matches.values()))
+
+
+def format_label(fmt):
+    """'%d/%m/%Y' -> 'DD/MM/YYYY'."""
+    for code, label in (("%d", "DD"), ("%m", "MM"), ("%Y", "YYYY"), ("%y", "YY"), ("%b", "Mon")):
+        fmt = fmt.replace(code, label)
+    return fmt
+
+
+def parse_amount(value):
+    """Parse '₹1,234.50', '(12.00)', '12.00 Dr' and friends into a signed float."""
+    text = value.strip()
+    if not text:
+        return None
+    sign = 1
+    if text.startswith("(") and text.endswith(")"):
+        sign, text = -1, text[1:-1]
+    lowered = text.lower()
+    if lowered.endswith("dr"):
+        sign, text = -1, text[:-2]
+    elif lowered.endswith("cr"):
+        text = text[:-2]
+    text = re.sub(r"(?i)rs\.?|inr|₹|,|\s", "", text)
+    try:
+        return sign * float(text)
+    except ValueError:
+        raise RowError(f"unrecognised amount {value!r}")
+
+
+def normalize_category(value, note=""):
+    value = (value or "").strip()
+    for category in db.EXPENSE_CATEGORIES:
+        if value.lower() == category.lower():
+            return category
+    haystack = f"{value} {note}".lower()
+    for category, words in CATEGORY_HINTS.items():
+        if any(word in haystack for word in words):
+            return category
+    return "Others"
+
+
+# --------- Readers ----------
+# Each reader yields (line_no, dict) records with raw date/amount/category/source/note.
+def _map_header(header):
+    mapping = {}
+    for i, name in enumerate(header):
+        name = re.sub(r"[^a-z ]", "", name.strip().lower()).strip()
+        for field, aliases in HEADER_ALIASES.items():
+            if name in aliases and field not in mapping:
+                mapping[field] = i
+    if "date" not in mapping or not ({"amount", "debit", "credit"} & mapping.keys()):
+        raise RowError(f"CSV needs a date column and an amount or debit/credit column, got {header}")
+    return mapping
+
+
+def read_csv(stream):
+    reader = csv.reader(stream)
+    header = next(reader, None)
+    if header is None:
+        raise RowError("empty file")
+    mapping = _map_header(header)
+    for line_no, row in enumerate(reader, start=2):
+        if not any(cell.strip() for cell in row):
+            continue
+        record = {field: row[i] if i < len(row) else "" for field, i in mapping.items()}
+        yield line_no, record
+
+
+_OFX_TAG = re.compile(r"<(/?)([A-Za-z.]+)>([^<\r\n]*)")
+
+
+def read_ofx(stream):
+    txn = None
+    for line_no, line in enumerate(stream, start=1):
+        for closing, tag, value in _OFX_TAG.findall(line):
+            tag = tag.upper()
+            if tag == "STMTTRN":
+                if closing and txn is not None:
+                    note = " ".join(v for v in (txn.get("NAME"), txn.get("MEMO")) if v)
+                    yield txn["line"], {"date": txn.get("DTPOSTED", "")[:8], "amount": txn.get("TRNAMT", ""),
+                                        "source": txn.get("NAME", ""), "note": note}
+                    txn = None
+                elif not closing:
+                    txn = {"line": line_no}
+            elif txn is not None and not closing:
+                txn[tag] = value.strip()
+
+
+# --------- Pipeline ----------
+def normalize(record, kind, parse_date):
+    """Return (table, row) for one raw record; row matches the table's insert column order."""
+    date = parse_date(record.get("date", ""))
+    note = (record.get("note") or "").strip()
+    amount = parse_amount(record.get("amount", "") or "")
+    if amount is None:
+        debit = parse_amount(record.get("debit", "") or "")
+        credit = parse_amount(record.get("credit", "") or "")
+        if debit:
+            amount = -abs(debit)
+        elif credit:
+            amount = abs(credit)
+        else:
+            raise RowError("no amount")
+    if kind == "auto":
+        table = "expenses" if amount < 0 else "income"
+    else:
+        table = kind
+    amount = abs(amount)
+    if amount == 0:
+        raise RowError("zero amount")
+    if table == "expenses":
+        group = normalize_category(record.get("category"), note)
+    else:
+        group = (record.get("source") or "").strip() or "Imported"
+    return table, (date, round(amount, 2), group, note)
+
+
+def _normalized(records, kind, parse_date):
+    # Yields (line_no, (table, row)) or (line_no, RowError) for every record. A row
+    # whose date is ambiguous before the file's format is known waits in held (at
+    # most MAX_HELD of them) and is read again as soon as a later row settles it.
+    def attempt(record):
+        try:
+            return normalize(record, kind, parse_date)
+        except RowError as e:
+            return e
+
+    held = []
+    for line_no, record in records:
+        result = attempt(record)
+        if isinstance(result, AmbiguousDate) and len(held) < MAX_HELD:
+            held.append((line_no, record))
+            continue
+        yield line_no, result
+        if held and parse_date.format:
+            for held_line, held_record in held:
+                yield held_line, attempt(held_record)
+            held.clear()
+    for held_line, held_record in held:
+        yield held_line, attempt(held_record)
+
+
+@instrument.timed("import", rows=lambda stats: stats["read"])
+def import_stream(user_id, stream, fmt="csv", kind="auto", batch_size=BATCH_SIZE, progress=None, writer=db,
+                  date_format=None):
+    """Import a text stream of CSV or OFX records; returns a summary dict including rows_per_sec.
+
+    Batches go to writer.import_batch: db, or a backend.BackendClient when writes go through the backend.
+    date_format (e.g. '%d/%m/%Y') skips detection for files whose dates never settle it.
+    """
+    if kind not in ("auto", "expenses", "income"):
+        raise ValueError(f"Unknown kind: {kind}")
+    records = read_ofx(stream) if fmt in ("ofx", "qfx") else read_csv(stream)
+    stats = {"read": 0, "inserted": 0, "duplicates": 0, "rejected": 0, "errors": []}
+    # Dedupe against what was there before this import, not against its own earlier batches.
+    watermark = writer.import_watermark()
+    started = time.perf_counter()
+    batch = {"expenses": [], "income": []}
+    pending = 0
+    for line_no, result in _normalized(records, kind, DateParser(date_format=date_format)):
+        stats["read"] += 1
+        if isinstance(result, RowError):
+            stats["rejected"] += 1
+            if len(stats["errors"]) < MAX_ERRORS:
+                stats["errors"].append((line_no, str(result)))
+            continue
+        table, row = result
+        batch[table].append(row)
+        pending += 1
+        if pending >= batch_size:
+            _flush(writer, user_id, batch, watermark, stats, started, progress)
+            batch, pending = {"expenses": [], "income": []}, 0
+    if pending:
+        _flush(writer, user_id, batch, watermark, stats, started, progress)
+    stats["seconds"] = time.perf_counter() - started
+    stats["rows_per_sec"] = stats["read"] / stats["seconds"] if stats["seconds"] else 0.0
+    return stats
+
+
+def _flush(writer, user_id, batch, watermark, stats, started, progress):
+    inserted, duplicates = writer.import_batch(user_id, batch, watermark)
+    stats["inserted"] += inserted
+    stats["duplicates"] += duplicates
+    if progress:
+        elapsed = time.perf_counter() - started
+        progress(stats["read"], stats["read"] / elapsed if elapsed else 0.0)
+
+
+def detect_format(name):
+    return "ofx" if name.lower().endswith((".ofx", ".qfx")) else "csv"
+
+
+def import_upload(user_id, uploaded, kind="auto", progress=None, writer=db, date_format=None):
+    """Import a Streamlit UploadedFile (or any binary file object with a name)."""
+    stream = io.TextIOWrapper(uploaded, encoding="utf-8-sig", errors="replace", newline="")
+    return import_stream(user_id, stream, detect_format(uploaded.name), kind, progress=progress, writer=writer,
+                         date_format=date_format)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import a CSV or OFX bank statement.")
+    parser.add_argument("file", help="statement file (.csv, .ofx or .qfx)")
+    parser.add_argument("--user", required=True, help="username to import into")
+    parser.add_argument("--kind", choices=["auto", "expenses", "income"], default="auto",
+                        help="auto: negative amounts/debits are expenses, the rest income")
+    parser.add_argument("--date-format", choices=DATE_FORMATS, metavar="FORMAT",
+                        help="strptime format of the file's dates, e.g. %%d/%%m/%%Y (default: detect)")
+    parser.add_argument("--batch", type=int, default=BATCH_SIZE, help="rows per transaction")
+    parser.add_argument("--db", default=db.DB_PATH, help="database file (default: %(default)s)")
+    args = parser.parse_args()
+
+    pool = db.configure(args.db)
+    with pool.connection() as conn:
+        migrate(conn)
+    user = db.get_user(args.user)
+    if not user:
+        raise SystemExit(f"User {args.user!r} does not exist.")
+
+    def progress(read, rate):
+        print(f"  {read:,} rows read ({rate:,.0f} rows/s)", flush=True)
+
+    # With TRACKER_BACKEND set, batches go through the backend's single writer like the app's.
+    writer = backend.BackendClient() if backend.BACKEND_URL else db
+    with open(args.file, encoding="utf-8-sig", errors="replace", newline="") as stream:
+        stats = import_stream(user[0], stream, detect_format(args.file), args.kind, args.batch, progress,
+                              writer=writer, date_format=args.date_format)
+    for line_no, error in stats["errors"]:
+        print(f"  line {line_no}: {error}")
+    print(f"Imported {stats['inserted']:,} rows, skipped {stats['duplicates']:,} duplicates, "
+          f"rejected {stats['rejected']:,} in {stats['seconds']:.2f}s ({stats['rows_per_sec']:,.0f} rows/s).")
+
+
+if __name__ == "__main__":
+    main()
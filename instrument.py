@@ -0,0 +1,182 @@
+import functools
+import io
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Opt-in timing for the hot paths: DB helpers (with row counts), each view,
+# report building, bcrypt and the Ollama stream. Enable with TRACKER_METRICS=1;
+# when it is off, timed() hands back the undecorated function and span() a
+# shared no-op context, so the instrumented code pays nothing.
+#
+# Metrics are process-wide and can be read as Prometheus text or JSON lines,
+# from the admin diagnostics panel or (with TRACKER_METRICS_PORT) over HTTP.
+
+ENABLED = os.getenv("TRACKER_METRICS", "0").lower() in ("1", "true", "yes")
+METRICS_PORT = int(os.getenv("TRACKER_METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("TRACKER_METRICS_HOST", "127.0.0.1")  # 0.0.0.0 to let a remote Prometheus scrape
+# Usernames that see the diagnostics panel in the sidebar.
+ADMINS = {name.strip() for name in os.getenv("TRACKER_ADMINS", "").split(",") if name.strip()}
+
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_NULL = nullcontext()
+_lock = threading.Lock()
+_stats = {}  # name -> {"count", "seconds", "max", "rows", "errors", "buckets"}
+
+
+def record(name, seconds, rows=None, error=False):
+    with _lock:
+        stat = _stats.get(name)
+        if stat is None:
+            stat = _stats[name] = {"count": 0, "seconds": 0.0, "max": 0.0, "rows": 0, "errors": 0,
+                                   "buckets": [0] * len(BUCKETS)}
+        stat["count"] += 1
+        stat["seconds"] += seconds
+        stat["max"] = max(stat["max"], seconds)
+        if rows:
+            stat["rows"] += rows
+        if error:
+            stat["errors"] += 1
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                stat["buckets"][i] += 1
+                break
+
+
+class _Span:
+    __slots__ = ("name", "rows", "started")
+
+    def __init__(self, name):
+        self.name = name
+        self.rows = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Streamlit's rerun/stop are BaseExceptions, not failures.
+        record(self.name, time.perf_counter() - self.started, self.rows,
+               error=exc_type is not None and issubclass(exc_type, Exception))
+
+
+def span(name):
+    """Context manager timing its body under name; set .rows on it to count rows."""
+    return _Span(name) if ENABLED else _NULL
+
+
+def timed(name=None, rows=None):
+    """Decorator timing every call; rows, if given, maps the result to a row count."""
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+        metric = name or f"{fn.__module__}.{fn.__name__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _Span(metric) as s:
+                result = fn(*args, **kwargs)
+                if rows is not None:
+                    s.rows = rows(result)
+                return result
+        return wrapper
+    return decorate
+
+
+def snapshot():
+    """{name: stats} copy, with mean seconds added."""
+    with _lock:
+        stats = {name: dict(stat, buckets=list(stat["buckets"])) for name, stat in _stats.items()}
+    for stat in stats.values():
+        stat["mean"] = stat["seconds"] / stat["count"]
+    return stats
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+
+def prometheus(stats=None):
+    """Prometheus text exposition of the timings, one histogram labelled by operation."""
+    stats = snapshot() if stats is None else stats
+    lines = ["# HELP tracker_op_seconds Time spent per instrumented operation.",
+             "# TYPE tracker_op_seconds histogram"]
+    for name, stat in sorted(stats.items()):
+        cumulative = 0
+        for bound, count in zip(BUCKETS, stat["buckets"]):
+            cumulative += count
+            lines.append(f'tracker_op_seconds_bucket{{op="{name}",le="{bound}"}} {cumulative}')
+        lines.append(f'tracker_op_seconds_bucket{{op="{name}",le="+Inf"}} {stat["count"]}')
+        lines.append(f'tracker_op_seconds_sum{{op="{name}"}} {stat["seconds"]:.6f}')
+        lines.append(f'tracker_op_seconds_count{{op="{name}"}} {stat["count"]}')
+    for metric, help_text in (("rows", "Rows returned per operation."), ("errors", "Failed calls per operation.")):
+        lines.append(f"# HELP tracker_op_{metric}_total {help_text}")
+        lines.append(f"# TYPE tracker_op_{metric}_total counter")
+        for name, stat in sorted(stats.items()):
+            lines.append(f'tracker_op_{metric}_total{{op="{name}"}} {stat[metric]}')
+    return "\n".join(lines) + "\n"
+
+
+def jsonl(stats=None):
+    """One JSON object per operation, stamped with the current time."""
+    stats = snapshot() if stats is None else stats
+    now = time.time()
+    return "".join(json.dumps({"ts": now, "op": name, **{k: v for k, v in stat.items() if k != "buckets"}}) + "\n"
+                   for name, stat in sorted(stats.items()))
+
+
+def profile(fn, *args, **kwargs):
+    """Run fn once under pyinstrument (if installed) or cProfile; returns (result, text report)."""
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        Profiler = None
+    if Profiler is not None:
+        profiler = Profiler()
+        profiler.start()
+        try:
+            result = fn(*args, **kwargs)
+        finally:
+            profiler.stop()
+        return result, profiler.output_text(unicode=True)
+    import cProfile
+    import pstats
+    profiler = cProfile.Profile()
+    try:
+        result = profiler.runcall(fn, *args, **kwargs)
+    finally:
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(40)
+    return result, out.getvalue()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            body, content_type = prometheus(), "text/plain; version=0.0.4"
+        elif self.path == "/metrics.jsonl":
+            body, content_type = jsonl(), "application/x-ndjson"
+        else:
+            self.send_error(404)
+            return
+        body = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve(port=METRICS_PORT, host=METRICS_HOST):
+    """Serve /metrics (Prometheus) and /metrics.jsonl from a daemon thread; returns the server."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,111 @@
+import json
+import os
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import instrument
+
+# Streaming client for the Ollama chat API. One keep-alive session (and its
+# connection pool) is shared by every chat, and replies are yielded token by
+# token so the UI can render them as they arrive (st.write_stream).
+
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "phi3:3.8b")
+CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "180"))  # max silence between streamed chunks
+RETRIES = int(os.getenv("OLLAMA_RETRIES", "2"))
+# ngrok tunnels to the Colab server use self-signed certificates.
+VERIFY_TLS = os.getenv("OLLAMA_VERIFY_TLS", "0").lower() in ("1", "true", "yes")
+
+SYSTEM_PROMPT = "You are a helpful polite Indian finance advisor AI."
+
+
+class OllamaError(Exception):
+    pass
+
+
+class OllamaClient:
+    def __init__(self, host=OLLAMA_HOST, model=OLLAMA_MODEL, connect_timeout=CONNECT_TIMEOUT,
+                 read_timeout=READ_TIMEOUT, retries=RETRIES, backoff=0.5, verify=VERIFY_TLS, pool_size=16):
+        self.host = host.rstrip("/")
+        self.model = model
+        self.timeout = (connect_timeout, read_timeout)
+        self.verify = verify
+        self.session = requests.Session()
+        # Retry connection failures and gateway errors before any token is sent;
+        # a stream that breaks midway is surfaced rather than silently replayed.
+        retry = Retry(total=retries, connect=retries, read=0, status=retries, backoff_factor=backoff,
+                      status_forcelist=(502, 503, 504), allowed_methods=frozenset({"POST"}),
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def chat_stream(self, messages, cancel=None, metrics=None, options=None):
+        """Yield reply text chunks for messages as Ollama streams them.
+
+        cancel is an optional threading.Event; setting it stops the stream and closes
+        the connection. metrics, if given, is a dict filled in with ttft (seconds to
+        first token), tokens, tokens_per_sec and total (seconds).
+        """
+        payload = {"model": self.model, "messages": messages, "stream": True}
+        if options:
+            payload["options"] = options
+        started = time.perf_counter()
+        first = None
+        tokens = 0
+        final = {}
+        with self.session.post(f"{self.host}/api/chat", json=payload, stream=True,
+                               timeout=self.timeout, verify=self.verify) as response:
+            if response.status_code != 200:
+                raise OllamaError(f"Status Code: {response.status_code}\nResponse Text: {response.text}")
+            for line in response.iter_lines():
+                if cancel is not None and cancel.is_set():
+                    break
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if "error" in chunk:
+                    raise OllamaError(chunk["error"])
+                content = chunk.get("message", {}).get("content", "")
+                if content:
+                    if first is None:
+                        first = time.perf_counter()
+                    tokens += 1
+                    yield content
+                if chunk.get("done"):
+                    final = chunk
+                    break
+        total = time.perf_counter() - started
+        # Prefer Ollama's own eval counters; fall back to counting streamed chunks.
+        tokens = final.get("eval_count", tokens)
+        gen_seconds = final["eval_duration"] / 1e9 if final.get("eval_duration") else (
+            time.perf_counter() - first if first else 0)
+        if instrument.ENABLED:
+            instrument.record("llm.stream", total, tokens)
+            if first:
+                instrument.record("llm.ttft", first - started)
+        if metrics is not None:
+            metrics.update({
+                "ttft": (first - started) if first else None,
+                "tokens": tokens,
+                "tokens_per_sec": tokens / gen_seconds if gen_seconds else 0.0,
+                "total": total,
+            })
+
+    def chat(self, messages, **kwargs):
+        """Blocking convenience wrapper: the whole reply as one string."""
+        return "".join(self.chat_stream(messages, **kwargs))
+
+    def close(self):
+        self.session.close()
+
+
+def advisor_messages(context, prompt):
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": f"{context}\n\nQuestion: {prompt}"},
+    ]
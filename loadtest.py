@@ -0,0 +1,186 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+
+# Load test for backend.py: concurrent clients issue a read/write mix for a
+# fixed time and report requests per second and latency percentiles.
+#
+#   python loadtest.py --db bench_data/tracker-100k-1000u-s42.db --clients 16 --duration 20
+#   python loadtest.py --url http://localhost:8765 --db tracker.db --clients 32 --write-share 0.2
+#
+# Without --url a backend is started on a free port, over a temporary copy of
+# --db, and both are removed after the run. With --url, --db is the database
+# that backend serves: requests go to its existing users, and the expenses the
+# run added are deleted through the API afterwards.
+
+READ_MIX = [
+    # (weight, operation, args builder)
+    (4, "get_totals", lambda user: [user]),
+    (3, "get_history_page", lambda user: [user, "expenses"]),
+    (2, "count_history", lambda user: [user, "expenses"]),
+    (1, "get_group_totals", lambda user: [user, "expenses"]),
+    (1, "get_monthly_totals", lambda user: [user, "expenses"]),
+    (1, "search_history", lambda user: [user, "expenses", "food"]),
+]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] if ordered else 0.0
+
+
+def _client(url, token, users, write_share, deadline, seed, samples, errors, added):
+    rng = random.Random(seed)
+    session = requests.Session()
+    if token:
+        session.headers["X-Tracker-Token"] = token
+    weights = [w for w, _, _ in READ_MIX]
+    today = time.strftime("%Y-%m-%d")
+    while time.perf_counter() < deadline:
+        user = rng.choice(users)
+        if rng.random() < write_share:
+            op, args = "add_expense", [user, round(rng.uniform(10, 500), 2), "Food", "LOADTEST", today]
+        else:
+            _, op, build = rng.choices(READ_MIX, weights)[0]
+            args = build(user)
+        started = time.perf_counter()
+        try:
+            response = session.post(f"{url}/api/{op}", json={"args": args}, timeout=30)
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        samples.append((op, time.perf_counter() - started))
+        if ok and op == "add_expense":
+            added.append(response.json()["result"])
+        if not ok:
+            errors.append(op)
+
+
+def _copy_database(db_path, out_dir):
+    # The backup API includes anything still in the WAL.
+    path = os.path.join(out_dir, "loadtest.db")
+    source, target = sqlite3.connect(db_path), sqlite3.connect(path)
+    with target:
+        source.backup(target)
+    source.close()
+    target.close()
+    return path
+
+
+def _user_ids(db_path, limit):
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        return [row[0] for row in conn.execute("SELECT id FROM users ORDER BY id LIMIT ?", (limit,))]
+    finally:
+        conn.close()
+
+
+def _cleanup(url, token, ids):
+    session = requests.Session()
+    if token:
+        session.headers["X-Tracker-Token"] = token
+    for expense_id in ids:
+        session.post(f"{url}/api/delete_expense", json={"args": [expense_id]}, timeout=30)
+
+
+def _start_backend(db_path):
+    import socket
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    proc = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend.py"),
+                             "--db", db_path, "--port", str(port)], stdout=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            requests.get(f"{url}/health", timeout=1)
+            return proc, url
+        except requests.RequestException:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("backend did not start")
+
+
+def run(url, token, users, clients, duration, write_share, seed=42):
+    samples, errors, added = [], [], []
+    deadline = time.perf_counter() + duration
+    threads = [threading.Thread(target=_client, args=(url, token, users, write_share, deadline, seed + i,
+                                                      samples, errors, added))
+               for i in range(clients)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    latencies = [s for _, s in samples]
+    by_op = {}
+    for op, seconds in samples:
+        by_op.setdefault(op, []).append(seconds)
+    return {
+        "clients": clients, "duration": elapsed, "requests": len(samples), "errors": len(errors),
+        "rps": len(samples) / elapsed, "write_share": write_share, "added": added,
+        "p50": percentile(latencies, 50), "p95": percentile(latencies, 95), "p99": percentile(latencies, 99),
+        "ops": {op: {"requests": len(v), "p50": percentile(v, 50), "p99": percentile(v, 99),
+                     "mean": statistics.fmean(v)} for op, v in sorted(by_op.items())},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure backend requests/s and latency percentiles.")
+    parser.add_argument("--url", help="running backend (default: start one on a temporary copy of --db)")
+    parser.add_argument("--db", required=True,
+                        help="database to copy for the started backend, or the one --url serves")
+    parser.add_argument("--token", default=os.getenv("TRACKER_BACKEND_TOKEN", ""))
+    parser.add_argument("--clients", type=int, default=8, help="concurrent client threads")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--write-share", type=float, default=0.1, help="fraction of requests that add an expense")
+    parser.add_argument("--users", type=int, default=100, help="spread requests over this many existing users")
+    parser.add_argument("--json", help="write the summary to this file")
+    args = parser.parse_args()
+
+    users = _user_ids(args.db, args.users)
+    if not users:
+        raise SystemExit(f"{args.db} has no users to load.")
+    proc = scratch = None
+    url = args.url
+    try:
+        if not url:
+            scratch = tempfile.mkdtemp(prefix="loadtest-")
+            proc, url = _start_backend(_copy_database(args.db, scratch))
+        result = run(url, args.token, users, args.clients, args.duration, args.write_share)
+        if args.url:
+            _cleanup(url, args.token, result["added"])
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait()
+        if scratch:
+            shutil.rmtree(scratch, ignore_errors=True)
+    result["added"] = len(result["added"])
+    print(f"{result['requests']:,} requests in {result['duration']:.1f}s from {result['clients']} clients: "
+          f"{result['rps']:,.0f} req/s, p50 {result['p50'] * 1000:.1f}ms, p95 {result['p95'] * 1000:.1f}ms, "
+          f"p99 {result['p99'] * 1000:.1f}ms, {result['errors']} errors")
+    for op, stat in result["ops"].items():
+        print(f"  {op:<20} {stat['requests']:>7,}  p50 {stat['p50'] * 1000:7.1f}ms  p99 {stat['p99'] * 1000:7.1f}ms")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=1)
+    if result["errors"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the Ollama chat API (POST /api/chat), for exercising llm.py
+# and the AI Chatbot tab without a model:
+#
+#   python ollama_stub.py --port 11435 --delay 0.05
+#   OLLAMA_HOST=http://localhost:11435 streamlit run app.py
+#
+# Streams a canned reply word by word as NDJSON, like Ollama does with stream=true.
+
+REPLY = ("Based on your snapshot, try to keep monthly expenses under 70% of income "
+         "and move the surplus into a recurring deposit or index fund SIP.")
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so pooled clients reuse the socket
+    delay = 0.0
+    first_token_delay = 0.0
+    reply = REPLY
+
+    def log_message(self, *args):
+        pass
+
+    def handle(self):
+        try:
+            super().handle()
+        except ConnectionResetError:
+            pass  # client dropped a kept-alive socket
+
+    def do_POST(self):
+        if self.path != "/api/chat":
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        model = body.get("model", "stub")
+        words = self.reply.split(" ")
+        if not body.get("stream", True):
+            self._send_json({"model": model, "message": {"role": "assistant", "content": self.reply},
+                             "done": True})
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        started = time.perf_counter()
+        time.sleep(self.first_token_delay)
+        try:
+            for i, word in enumerate(words):
+                self._chunk({"model": model, "message": {"role": "assistant",
+                             "content": word if i == 0 else " " + word}, "done": False})
+                time.sleep(self.delay)
+            self._chunk({"model": model, "message": {"role": "assistant", "content": ""}, "done": True,
+                         "eval_count": len(words),
+                         "eval_duration": int((time.perf_counter() - started) * 1e9)})
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # client cancelled
+
+    def _chunk(self, obj):
+        data = json.dumps(obj).encode() + b"\n"
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, obj):
+        data = json.dumps(obj).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def serve(port=0, delay=0.0, first_token_delay=0.0, reply=REPLY):
+    """Start the stub on a background thread; returns the server (server.server_address has the port)."""
+    handler = type("StubHandler", (Handler,), {"delay": delay, "first_token_delay": first_token_delay,
+                                               "reply": reply})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a fake Ollama /api/chat endpoint.")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--delay", type=float, default=0.05, help="seconds between streamed words")
+    parser.add_argument("--first-token-delay", type=float, default=0.3)
+    args = parser.parse_args()
+    server = serve(args.port, args.delay, args.first_token_delay)
+    print(f"Stub Ollama listening on http://127.0.0.1:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
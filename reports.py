@@ -0,0 +1,85 @@
+import analytics
+import instrument
+from cache import cached
+
+# Figure specs for the Reports view. Specs are plain plotly dicts cached per
+# (user, data version, date range, snapshot time) in the shared query cache, so
+# reruns that don't change the data or the range skip both the SQL rollups and
+# Plotly. plotly is imported on first build, not at app start. The rollups come
+# from the configured analytics engine (SQLite by default, or DuckDB; see
+# analytics.py). A DuckDB Parquet snapshot doesn't change with the user's data
+# version, so its time is part of the key.
+
+MAX_POINTS = 120  # longest trend series sent to the browser
+
+
+def downsample(months, max_points=MAX_POINTS):
+    """Re-bucket [(YYYY-MM, amount)] into quarters, then years, until it fits in max_points."""
+    if len(months) <= max_points:
+        return months
+    for bucket in (lambda m: f"{m[:4]}-Q{(int(m[5:7]) - 1) // 3 + 1}", lambda m: m[:4]):
+        sums = {}
+        for month, amount in months:
+            key = bucket(month)
+            sums[key] = sums.get(key, 0) + amount
+        if len(sums) <= max_points:
+            break
+    return list(sums.items())
+
+
+def _trend(user_id, table, date_from, date_to, title):
+    import plotly.express as px
+    df = analytics.engine().get_monthly_totals(user_id, table, date_from, date_to)
+    if df.empty:
+        return None
+    points = downsample(list(zip(df["month"], df["amount"])))
+    fig = px.line(x=[p[0] for p in points], y=[p[1] for p in points], markers=True, title=title,
+                  line_shape='spline', labels={'x': 'month', 'y': 'amount'})
+    return fig.to_dict()
+
+
+def _year_over_year(user_id, date_from, date_to):
+    import plotly.express as px
+    df = analytics.engine().get_year_over_year(user_id, "expenses", date_from, date_to)
+    if df["year"].nunique() < 2:
+        return None
+    fig = px.line(df, x="month", y="amount", color="year", markers=True, title='Monthly Expenses by Year')
+    fig.update_xaxes(tickmode="array", tickvals=list(range(1, 13)),
+                     ticktext=["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"])
+    return fig.to_dict()
+
+
+def date_bounds(user_id, as_of=None):
+    """(first, last) expense date as the analytics engine sees it; as_of only keys the cache."""
+    return analytics.engine().get_date_bounds(user_id, "expenses")
+
+
+@instrument.timed("reports.build_figures")
+def build_figures(user_id, date_from=None, date_to=None, as_of=None):
+    """[(subheader, figure dict)] for the Reports view; empty when there are no expenses."""
+    import plotly.express as px
+    cat_grouped = analytics.engine().get_group_totals(user_id, "expenses", date_from, date_to)
+    if cat_grouped.empty:
+        return []
+    fig_pie = px.pie(cat_grouped, names="category", values="amount", title="Expenses by Category",
+                     color_discrete_sequence=px.colors.sequential.RdBu, hole=0.35)
+    fig_pie.update_traces(marker=dict(line=dict(color='#fff', width=2)), textinfo="percent+label+value")
+    bar = px.bar(cat_grouped.sort_values('amount'), x='amount', y='category', orientation='h',
+                 labels={'amount': 'Total Spent', 'category': 'Category'}, color='amount',
+                 color_continuous_scale='Aggrnyl')
+    figures = [
+        ("Expenses by Category (Pie Chart)", fig_pie.to_dict()),
+        ("Top Spending Categories (Bar Chart)", bar.to_dict()),
+        ("Month-wise Trends", _trend(user_id, "expenses", date_from, date_to, 'Monthly Expenses Trend')),
+    ]
+    inc_line = _trend(user_id, "income", date_from, date_to, 'Monthly Income Trend')
+    if inc_line:
+        figures.append((None, inc_line))
+    yoy = _year_over_year(user_id, date_from, date_to)
+    if yoy:
+        figures.append(("Year-over-Year", yoy))
+    return figures
+
+
+report_bounds = cached(date_bounds)
+figure_specs = cached(build_figures)
@@ -0,0 +1,155 @@
+import argparse
+import sqlite3
+
+from db import DB_PATH
+
+# Materialized per-user summaries kept in step with expenses/income by triggers,
+# so dashboard metrics and report charts read O(months) rows instead of every
+# transaction. check() compares them against the base tables, rebuild() recomputes them.
+#
+#   user_totals      (user_id)                   running income/expense totals
+#   expense_monthly  (user_id, month, category)  sums per month and category
+#   income_monthly   (user_id, month, source)    sums per month and source
+#
+# Rows whose date SQLite can't parse are bucketed under month ''.
+
+TOLERANCE = 0.005
+MONTH = "COALESCE(strftime('%Y-%m', {row}.date), '')"
+
+SUMMARIES = {
+    # base table: (summary table, group column, user_totals column)
+    "expenses": ("expense_monthly", "category", "expense"),
+    "income": ("income_monthly", "source", "income"),
+}
+
+TABLES = [
+    '''
+    CREATE TABLE IF NOT EXISTS user_totals (
+        user_id INTEGER PRIMARY KEY,
+        income REAL NOT NULL DEFAULT 0,
+        expense REAL NOT NULL DEFAULT 0
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS expense_monthly (
+        user_id INTEGER NOT NULL,
+        month TEXT NOT NULL,
+        category TEXT NOT NULL,
+        amount REAL NOT NULL DEFAULT 0,
+        n INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, month, category)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS income_monthly (
+        user_id INTEGER NOT NULL,
+        month TEXT NOT NULL,
+        source TEXT NOT NULL,
+        amount REAL NOT NULL DEFAULT 0,
+        n INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, month, source)
+    ) WITHOUT ROWID
+    ''',
+]
+
+
+def _apply(table, row, sign):
+    """Statements adding (sign=+1) or removing (sign=-1) one base row's contribution."""
+    summary, column, total = SUMMARIES[table]
+    month = MONTH.format(row=row)
+    amount = f"{sign} * COALESCE({row}.amount, 0)"
+    stmts = [
+        f'''INSERT INTO user_totals (user_id, {total}) VALUES ({row}.user_id, {amount})
+            ON CONFLICT (user_id) DO UPDATE SET {total} = {total} + excluded.{total};''',
+        f'''INSERT INTO {summary} (user_id, month, {column}, amount, n)
+            VALUES ({row}.user_id, {month}, COALESCE({row}.{column}, ''), {amount}, {sign})
+            ON CONFLICT (user_id, month, {column})
+            DO UPDATE SET amount = amount + excluded.amount, n = n + excluded.n;''',
+    ]
+    if sign < 0:
+        stmts.append(f'''DELETE FROM {summary} WHERE user_id = {row}.user_id AND month = {month}
+            AND {column} = COALESCE({row}.{column}, '') AND n <= 0;''')
+    return "\n".join(stmts)
+
+
+def triggers(table):
+    return [
+        f'''CREATE TRIGGER IF NOT EXISTS {table}_summary_insert AFTER INSERT ON {table}
+            BEGIN {_apply(table, "NEW", 1)} END''',
+        f'''CREATE TRIGGER IF NOT EXISTS {table}_summary_delete AFTER DELETE ON {table}
+            BEGIN {_apply(table, "OLD", -1)} END''',
+        f'''CREATE TRIGGER IF NOT EXISTS {table}_summary_update AFTER UPDATE ON {table}
+            BEGIN {_apply(table, "OLD", -1)} {_apply(table, "NEW", 1)} END''',
+    ]
+
+
+def rebuild(conn, user_id=None):
+    """Recompute summaries from the base tables (one user, or everyone). Caller owns the transaction."""
+    where, params = ("WHERE user_id = ?", (user_id,)) if user_id is not None else ("", ())
+    conn.execute(f"DELETE FROM user_totals {where}", params)
+    for table, (summary, column, total) in SUMMARIES.items():
+        conn.execute(f"DELETE FROM {summary} {where}", params)
+        conn.execute(f'''
+            INSERT INTO {summary} (user_id, month, {column}, amount, n)
+            SELECT user_id, {MONTH.format(row=table)}, COALESCE({column}, ''),
+                   SUM(COALESCE(amount, 0)), COUNT(*)
+            FROM {table} {where} GROUP BY 1, 2, 3
+        ''', params)
+        conn.execute(f'''
+            INSERT INTO user_totals (user_id, {total})
+            SELECT user_id, SUM(amount) FROM {summary} {where} GROUP BY user_id
+            ON CONFLICT (user_id) DO UPDATE SET {total} = excluded.{total}
+        ''', params)
+
+
+def check(conn, tolerance=TOLERANCE):
+    """Return a list of (summary, key, stored, actual) rows that disagree with the base tables."""
+    mismatches = []
+    for table, (summary, column, total) in SUMMARIES.items():
+        actual = {
+            (u, m, c): (a, n) for u, m, c, a, n in conn.execute(f'''
+                SELECT user_id, {MONTH.format(row=table)}, COALESCE({column}, ''),
+                       SUM(COALESCE(amount, 0)), COUNT(*)
+                FROM {table} GROUP BY 1, 2, 3''')
+        }
+        stored = {(u, m, c): (a, n) for u, m, c, a, n in
+                  conn.execute(f"SELECT user_id, month, {column}, amount, n FROM {summary}")}
+        for key in actual.keys() | stored.keys():
+            a, s = actual.get(key, (0, 0)), stored.get(key, (0, 0))
+            if a[1] != s[1] or abs(a[0] - s[0]) > tolerance:
+                mismatches.append((summary, key, s, a))
+
+        actual_totals = dict(conn.execute(
+            f"SELECT user_id, SUM(COALESCE(amount, 0)) FROM {table} GROUP BY user_id"))
+        stored_totals = dict(conn.execute(f"SELECT user_id, {total} FROM user_totals"))
+        for user_id in actual_totals.keys() | stored_totals.keys():
+            a, s = actual_totals.get(user_id, 0), stored_totals.get(user_id, 0)
+            if abs(a - s) > tolerance:
+                mismatches.append((f"user_totals.{total}", (user_id,), s, a))
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check or rebuild the per-user summary tables.")
+    parser.add_argument("--db", default=DB_PATH, help="database file (default: %(default)s)")
+    parser.add_argument("--rebuild", action="store_true", help="recompute summaries from base tables")
+    parser.add_argument("--user", type=int, help="only rebuild this user_id")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    if args.rebuild:
+        conn.execute("BEGIN IMMEDIATE")
+        rebuild(conn, args.user)
+        conn.commit()
+        print("Summaries rebuilt.")
+    mismatches = check(conn)
+    conn.close()
+    for summary, key, stored, actual in mismatches:
+        print(f"MISMATCH {summary} {key}: stored={stored} actual={actual}")
+    if mismatches:
+        raise SystemExit(1)
+    print("Summaries are consistent.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+import pytest
+
+pytest.importorskip("duckdb")
+pytest.importorskip("pyarrow")
+
+import analytics
+import bench
+import db
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    # Each test gets its own database and pool; monkeypatch puts the previous pool back.
+    path = str(tmp_path / "tracker.db")
+    bench.generate(path, 1000, 10)
+    pool = db.ConnectionPool(path)
+    monkeypatch.setattr(db, "_pool", pool)
+    yield path
+    pool.close()
+
+
+@pytest.fixture
+def snapshot_dir(database, tmp_path):
+    out = str(tmp_path / "snapshot")
+    analytics.snapshot(out)
+    return out
+
+
+def test_duckdb_matches_sqlite(snapshot_dir):
+    assert analytics.check(analytics.DuckDBAnalytics(snapshot_dir)) == []
+
+
+def test_snapshot_is_dated_and_ignores_later_writes(snapshot_dir):
+    engine = analytics.DuckDBAnalytics(snapshot_dir)
+    assert engine.as_of() is not None
+    before = engine.get_date_bounds(1, "expenses")
+    db.add_expense(1, 5.0, "Food", "after snapshot", "2099-01-01")
+    assert engine.get_date_bounds(1, "expenses") == before
+    assert db.get_date_bounds(1, "expenses")[1] == "2099-01-01"
@@ -0,0 +1,18 @@
+import sqlite3
+
+import bench
+from db_init import LATEST_VERSION, check_query_plans, current_version, migrate
+
+
+def test_empty_database_uses_indexes(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "tracker.db"), isolation_level=None)
+    migrate(conn)
+    assert current_version(conn) == LATEST_VERSION
+    assert check_query_plans(conn) == []
+
+
+def test_populated_database_uses_indexes(tmp_path):
+    path = str(tmp_path / "tracker.db")
+    bench.generate(path, 1000, 10)
+    conn = sqlite3.connect(path, isolation_level=None)
+    assert check_query_plans(conn) == []